@@ -1,7 +1,9 @@
+import bisect
 from collections import OrderedDict, namedtuple
 import colorsys
 import datetime
 import math
+import struct
 
 from werkzeug.utils import cached_property
 import numpy as np
@@ -10,6 +12,19 @@ import numpy as np
 _Block = namedtuple('Block',
                     ['index', 'chart', 'entry', 'start', 'end', 'length'])
 
+# an arrow from a block to one which depends on it, which starts and ends at
+# the top and bottom rows it passes through so it can be found by them with
+# an IntervalIndex
+Dependency = namedtuple('Dependency',
+                        ['index', 'block', 'dependee_block', 'start', 'end'])
+
+
+# see Chart.as_binary
+SCHEDULE_MAGIC = b'GNTT'
+SCHEDULE_VERSION = 1
+SCHEDULE_HEADER = struct.Struct('<4sHHq7I')
+SCHEDULE_ENTRY_TYPES = ('task', 'milestone')
+
 
 class InvalidGanttChart(ValueError):
     pass
@@ -20,11 +35,11 @@ class CyclicGraphError(InvalidGanttChart):
 
 
 class Block(_Block):
-    def as_json(self):
+    def as_json(self, shared=None):
         return {
             'start': self.start.isoformat(),
             'end': self.end.isoformat(),
-            'entry': self.entry.as_json(),
+            'entry': self.entry.as_json(shared=shared),
         }
 
     @cached_property
@@ -85,6 +100,70 @@ class Block(_Block):
             and (self.entry.has_member(account) or not self.entry.members)
 
 
+class IntervalIndex:
+    """
+    An index over blocks which finds those overlapping a window of time.
+
+    Blocks are kept sorted by their start, with an implicit balanced tree over
+    that order which records the latest end of every subtree. A query only
+    descends into subtrees which can contain an overlapping block, so it takes
+    time logarithmic in the number of blocks plus the size of the output.
+
+    Anything else with an index, a start and an end can be indexed the same
+    way, such as dependencies by the rows they pass through.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = sorted(blocks, key=lambda block: (block.start,
+                                                        block.index))
+        self.starts = [block.start for block in self.blocks]
+        self.max_ends = [None] * len(self.blocks)
+        self._build(0, len(self.blocks))
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+
+        mid = (lo + hi) // 2
+
+        max_end = self.blocks[mid].end
+        for child_max_end in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child_max_end is not None and child_max_end > max_end:
+                max_end = child_max_end
+
+        self.max_ends[mid] = max_end
+        return max_end
+
+    def _query(self, lo, hi, limit, start, results):
+        if lo >= hi or lo >= limit:
+            return
+
+        mid = (lo + hi) // 2
+        if self.max_ends[mid] < start:
+            return
+
+        self._query(lo, mid, limit, start, results)
+
+        if mid < limit and self.blocks[mid].end >= start:
+            results.append(self.blocks[mid])
+
+        self._query(mid + 1, hi, limit, start, results)
+
+    def overlapping(self, start, end):
+        """
+        Find the blocks which overlap the window from start to end, inclusive,
+        in the order they appear in the chart.
+        """
+
+        # only blocks which start before the window ends can overlap it
+        limit = bisect.bisect_right(self.starts, end)
+
+        results = []
+        self._query(0, len(self.blocks), limit, start, results)
+        results.sort(key=lambda block: block.index)
+        return results
+
+
 class Chart:
     def __init__(self, project):
         self.project = project
@@ -312,6 +391,42 @@ class Chart:
 
         return matrix
 
+    @cached_property
+    def interval_index(self):
+        return IntervalIndex(self.blocks.values())
+
+    def blocks_between(self, start, end):
+        """Find the blocks which overlap the window from start to end."""
+        return self.interval_index.overlapping(start, end)
+
+    @cached_property
+    def dependencies(self):
+        """The dependency arrows between blocks, in the order they're drawn."""
+
+        dependencies = []
+        for block in self.blocks.values():
+            for dependee in block.entry.dependees:
+                dependee_block = self.blocks[dependee.parent]
+                dependencies.append(Dependency(
+                    len(dependencies), block, dependee_block,
+                    min(block.index, dependee_block.index),
+                    max(block.index, dependee_block.index)))
+        return dependencies
+
+    @cached_property
+    def dependency_index(self):
+        return IntervalIndex(self.dependencies)
+
+    def dependencies_between(self, top, bottom):
+        """Find the dependency arrows which pass through rows top to bottom."""
+        return self.dependency_index.overlapping(top, bottom)
+
+    def blocks_on(self, date):
+        """Find the blocks which overlap a certain date."""
+        start = datetime.datetime.combine(date, datetime.time.min)
+        end = datetime.datetime.combine(date, datetime.time.max)
+        return self.blocks_between(start, end)
+
     @cached_property
     def no_days(self):
         return math.ceil((self.end - self.start).days) + 1
@@ -346,9 +461,190 @@ class Chart:
 
         return graph_sorted
 
-    def as_json(self):
+    def as_json(self, blocks=None):
+        if blocks is None:
+            blocks = self.blocks.values()
+
+        # the resources and members of the entries are only built once
+        shared = {}
+
         return {
-            'blocks': [b.as_json() for b in self.blocks.values()],
+            'blocks': [b.as_json(shared) for b in blocks],
             'start': self.start.isoformat(),
             'end': self.end.isoformat(),
         }
+
+    def as_compact_json(self, blocks=None):
+        """
+        Produce a columnar encoding of the chart.
+
+        Blocks are described by parallel arrays of offsets and lengths, which
+        refer by index into single tables of entries, resources and members.
+        Offsets and lengths are in cells of the chart, a business day's worth
+        of hours to each calendar day, so weekends and holidays take up cells
+        like any other day.
+        """
+
+        if blocks is None:
+            blocks = self.blocks.values()
+
+        def index_in(table, indexes, item, **kwargs):
+            try:
+                return indexes[item]
+            except KeyError:
+                indexes[item] = len(table)
+                table.append(item.as_json(**kwargs))
+                return indexes[item]
+
+        entries = []
+        resources = []
+        resource_indexes = {}
+        members = []
+        member_indexes = {}
+
+        columns = {'entry': [], 'start': [], 'length': []}
+
+        for block in blocks:
+            entry = block.entry
+
+            columns['entry'].append(len(entries))
+            columns['start'].append(block.left_cells)
+            columns['length'].append(block.cells)
+
+            entries.append({
+                'id': entry.id,
+                'name': entry.name,
+                'description': entry.description,
+                'type': entry.type.name,
+                'time_estimates': {
+                    'normal': entry.normal_time_estimate,
+                    'pessimistic': entry.pessimistic_time_estimate
+                },
+                'min_start_date': entry.min_start_date.isoformat()
+                if entry.min_start_date else None,
+                'dependencies': [dep.child_id for dep in entry.dependencies],
+                'resources': [
+                    [index_in(resources, resource_indexes, res.resource),
+                     res.amount]
+                    for res in entry.resources
+                ],
+                'members': [
+                    index_in(members, member_indexes, member.member,
+                             minimal=True)
+                    for member in entry.members
+                ],
+            })
+
+        return {
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'blocks': columns,
+            'entries': entries,
+            'resources': resources,
+            'members': members,
+        }
+
+    def as_binary(self, blocks=None):
+        """
+        Produce a binary encoding of the chart, for drawing it in a browser.
+
+        After a header come sections which can each be read as a typed array,
+        all little endian:
+
+        * the header: the magic bytes ``GNTT``, the version and the length of
+          a business day as uint16s, the start of the chart in seconds since
+          the epoch as an int64, and then as uint32s the number of days,
+          rows, blocks, dependencies, runs of non-working days, colours and
+          strings.
+        * uint32 arrays with an element per block of its row, entry ID,
+          offset and length (in cells from the start of the chart, as in
+          ``as_compact_json``) and the string index of its name.
+        * uint32 pairs of the rows of the blocks at either end of each
+          dependency, of the first day and length of each run of
+          non-working days, and of the string indexes of the fill and stroke
+          of each colour.
+        * uint32 offsets of each string in the string data, plus its end.
+        * a uint16 colour index and then a uint8 type (an index into
+          ``SCHEDULE_ENTRY_TYPES``) per block, each padded to four bytes.
+        * the UTF-8 string data.
+        """
+
+        if blocks is None:
+            blocks = self.blocks.values()
+        blocks = list(blocks)
+
+        strings = []
+        string_indexes = {}
+
+        def index_in(table, indexes, item):
+            try:
+                return indexes[item]
+            except KeyError:
+                indexes[item] = len(table)
+                table.append(item)
+                return indexes[item]
+
+        colours = []
+        colour_indexes = {}
+
+        columns = {
+            'row': [], 'entry': [], 'start': [], 'length': [], 'name': [],
+            'colour': [], 'type': [],
+        }
+
+        for block in blocks:
+            columns['row'].append(block.index)
+            columns['entry'].append(block.entry.id)
+            columns['start'].append(block.left_cells)
+            columns['length'].append(block.cells)
+            columns['name'].append(
+                index_in(strings, string_indexes, block.entry.name))
+
+            colour = (index_in(strings, string_indexes, block.fill_colour),
+                      index_in(strings, string_indexes, block.stroke_colour))
+            columns['colour'].append(index_in(colours, colour_indexes, colour))
+            columns['type'].append(
+                SCHEDULE_ENTRY_TYPES.index(block.entry.type.name))
+
+        rows = set(columns['row'])
+        dependencies = []
+        for block in blocks:
+            for dependee in block.entry.dependees:
+                dependee_block = self.blocks[dependee.parent]
+                if dependee_block.index in rows:
+                    dependencies.append((block.index, dependee_block.index))
+
+        calendar = self.project.calendar
+        runs = calendar.non_working_runs(self.start.date(), self.no_days)
+
+        encoded_strings = [string.encode('utf-8') for string in strings]
+        string_offsets = np.cumsum([0] + [len(s) for s in encoded_strings])
+
+        def array(values, dtype):
+            data = np.array(values, dtype=dtype).tobytes()
+            return data + bytes(-len(data) % 4)
+
+        epoch = datetime.datetime(1970, 1, 1)
+
+        header = SCHEDULE_HEADER.pack(
+            SCHEDULE_MAGIC, SCHEDULE_VERSION,
+            calendar.business_day_length,
+            int((self.start - epoch).total_seconds()),
+            self.no_days, len(self.blocks), len(blocks), len(dependencies),
+            len(runs), len(colours), len(strings))
+
+        return b''.join([
+            header,
+            array(columns['row'], '<u4'),
+            array(columns['entry'], '<u4'),
+            array(columns['start'], '<u4'),
+            array(columns['length'], '<u4'),
+            array(columns['name'], '<u4'),
+            array(dependencies, '<u4'),
+            array(runs, '<u4'),
+            array(colours, '<u4'),
+            array(string_offsets, '<u4'),
+            array(columns['colour'], '<u2'),
+            array(columns['type'], '<u1'),
+            b''.join(encoded_strings),
+        ])
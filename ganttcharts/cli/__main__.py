@@ -4,7 +4,7 @@ from argparse import ArgumentParser
 
 from .. import __description__
 
-from . import send_summary_emails
+from . import benchmark, render_worker, send_summary_emails
 
 
 def main():
@@ -13,6 +13,8 @@ def main():
     parser = ArgumentParser(description=__description__)
 
     subparsers = parser.add_subparsers(title='commands')
+    benchmark.add_subparser(subparsers)
+    render_worker.add_subparser(subparsers)
     send_summary_emails.add_subparser(subparsers)
     args = parser.parse_args()
 
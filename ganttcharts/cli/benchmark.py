@@ -0,0 +1,153 @@
+from collections import OrderedDict
+import json
+import timeit
+
+from .. import serialisation
+from ..chart import Chart
+from ..database import get_sql_connection
+from ..models import Session as SqlSession, load_project_graph
+
+
+__description__ = 'Time the hot paths of the API against a project.'
+
+REPEAT = 5
+
+
+def best_time(function, number):
+    """The quickest time a call of a function took, in milliseconds."""
+
+    times = timeit.repeat(function, repeat=REPEAT, number=number)
+    return min(times) / number * 1000
+
+
+def report(name, baseline, candidates, number):
+    """
+    Time a baseline and some candidates, each of which produces a document,
+    and print how they compare.
+    """
+
+    print(name)
+
+    baseline_time = best_time(baseline, number)
+    print('  {:<24} {:>9.3f} ms {:>10} bytes'
+          .format('as_json', baseline_time, len(baseline())))
+
+    for label, candidate in candidates.items():
+        candidate_time = best_time(candidate, number)
+        print('  {:<24} {:>9.3f} ms {:>10} bytes {:>6.2f}x'
+              .format(label, candidate_time, len(candidate()),
+                      baseline_time / candidate_time))
+
+
+def serialise_project(project, number):
+    """
+    Compare serialising the entry list and the chart the old way (nested
+    as_json documents, pretty printed like jsonify does) with the shared
+    documents and each installed encoder.
+    """
+
+    def old_dumps(document):
+        return json.dumps(document, indent=2).encode('utf-8')
+
+    def old_entries():
+        return old_dumps({'entries': [e.as_json() for e in project.entries]})
+
+    def new_entries(dumps):
+        def serialise():
+            shared = {}
+            return dumps({'entries': [e.as_json(shared=shared)
+                                      for e in project.entries]})
+        return serialise
+
+    report('entries', old_entries, OrderedDict(
+        ('shared + {}'.format(name),
+         new_entries(serialisation.ENCODERS[name]))
+        for name in serialisation.available_encoders()), number)
+
+    chart = Chart(project)
+
+    def old_chart():
+        return old_dumps({'gantt_chart': {
+            'blocks': [b.as_json() for b in chart.blocks.values()],
+            'start': chart.start.isoformat(),
+            'end': chart.end.isoformat(),
+        }})
+
+    def new_chart(dumps):
+        return lambda: dumps({'gantt_chart': chart.as_json()})
+
+    report('gantt chart', old_chart, OrderedDict(
+        ('shared + {}'.format(name), new_chart(serialisation.ENCODERS[name]))
+        for name in serialisation.available_encoders()), number)
+
+
+def benchmark_json(args):
+    if args.project_id is None:
+        raise SystemExit('The json benchmark needs a --project-id.')
+
+    get_sql_connection()
+
+    session = SqlSession()
+
+    try:
+        project = load_project_graph(session, args.project_id)
+        serialise_project(project, args.number)
+    finally:
+        SqlSession.remove()
+
+
+def benchmark_validation(args):
+    """
+    Compare validating the documents of the hot PATCH endpoints with a
+    validator made for the request, as they used to be, and with the
+    registered ones.
+    """
+
+    from cerberus import Validator
+
+    # the batch schemas are registered when their module is imported
+    from ..web import batch, validation  # noqa
+
+    documents = OrderedDict([
+        ('entry', {'name': 'Design', 'normal_time_estimate': '4',
+                   'pessimistic_time_estimate': 6,
+                   'min_start_date': '2015-10-01'}),
+        ('resource', {'name': 'Laptop', 'amount': '2', 'reusable': True}),
+        ('project', {'name': 'Website', 'description': 'A new website.'}),
+        ('entry_batch.create', {'op': 'create', 'id': 'a', 'name': 'Build',
+                                'type': 'task', 'normal_time_estimate': 2,
+                                'pessimistic_time_estimate': 3}),
+    ])
+
+    for name, document in documents.items():
+        schema = validation.get_validator(name).schema
+
+        def per_request():
+            Validator(schema).validate(document, update=True)
+
+        def registered():
+            validation.get_validator(name).validate(document, update=True)
+
+        old = best_time(per_request, args.number)
+        new = best_time(registered, args.number)
+
+        print('{:<20} {:>8.1f} us {:>8.1f} us {:>6.2f}x'
+              .format(name, old * 1000, new * 1000, old / new))
+
+
+BENCHMARKS = OrderedDict([
+    ('json', benchmark_json),
+    ('validation', benchmark_validation),
+])
+
+
+def command(args):
+    BENCHMARKS[args.benchmark](args)
+
+
+def add_subparser(subparsers):
+    parser = subparsers.add_parser('benchmark', help=__description__)
+    parser.add_argument('benchmark', choices=list(BENCHMARKS))
+    parser.add_argument('--project-id', type=int)
+    parser.add_argument('--number', type=int, default=20)
+    parser.set_defaults(func=command)
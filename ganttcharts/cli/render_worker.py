@@ -0,0 +1,135 @@
+import concurrent.futures
+import logging
+import os
+import time
+
+from sqlalchemy.orm.exc import NoResultFound
+
+from .. import rendering
+from ..chart import Chart, InvalidGanttChart
+from ..database import get_sql_connection
+from ..models import Session as SqlSession, load_project_graph
+
+
+__description__ = 'Render exports and thumbnails in the background.'
+
+POLL_INTERVAL = 1
+
+# how many processes rasterise the pages of raster PDFs, defaulting to the
+# number of CPUs
+PROCESSES_KEY = 'RENDER_PROCESSES'
+
+# how often the cache is checked for the renderings of other processes
+# taking it over its size
+EVICT_INTERVAL = 60
+
+logger = logging.getLogger(__name__)
+
+
+def create_pool():
+    """
+    Start the processes raster PDF pages are rasterised in.
+
+    This is done before connecting to the database, so that none of them are
+    forked holding a copy of its connection.
+    """
+
+    processes = os.environ.get(PROCESSES_KEY)
+    if processes is not None:
+        processes = int(processes)
+
+    pool = concurrent.futures.ProcessPoolExecutor(processes)
+
+    # Python 3.5 starts every process with the first task
+    pool.submit(int).result()
+
+    return pool
+
+
+def process_job(queue, cache, job, pool=None):
+    session = SqlSession()
+
+    try:
+        try:
+            project = load_project_graph(session, job['project_id'])
+        except NoResultFound:
+            queue.fail(job, 'Project does not exist.')
+            return
+
+        if job.get('type') == 'thumbnail':
+            key = rendering.thumbnail_key(project)
+
+            if cache.last_modified(key) is None:
+                try:
+                    chart = Chart(project)
+                except InvalidGanttChart:
+                    chart = None
+
+                data = rendering.render_thumbnail(chart, project)
+                cache.put(key, data)
+                cache.put(rendering.latest_thumbnail_key(project), data)
+        else:
+            zoom = job.get('zoom', 'hour')
+
+            key = rendering.export_key(project, job['format'], job['raster'],
+                                       zoom)
+
+            if cache.last_modified(key) is None:
+                try:
+                    chart = Chart(project)
+                except InvalidGanttChart:
+                    queue.fail(job, 'Project has no valid Gantt chart.')
+                    return
+
+                data = rendering.render_export(chart, project, job['format'],
+                                               job['raster'], zoom, pool)
+                cache.put(key, data)
+
+        queue.complete(job, key)
+    except Exception:
+        logger.exception('Could not render job %s.', job['id'])
+        queue.fail(job, 'Could not render.')
+    finally:
+        SqlSession.remove()
+
+
+def work(forever, pool=None):
+    from ..web import app
+
+    queue = rendering.get_render_queue()
+    cache = rendering.get_render_cache()
+
+    last_evicted = time.monotonic()
+
+    with app.app_context():
+        while True:
+            job = queue.claim()
+
+            if job is not None:
+                process_job(queue, cache, job, pool)
+            elif forever:
+                queue.prune()
+
+                if time.monotonic() - last_evicted >= EVICT_INTERVAL:
+                    cache.evict()
+                    last_evicted = time.monotonic()
+
+                time.sleep(POLL_INTERVAL)
+            else:
+                break
+
+
+def command(args):
+    pool = create_pool()
+
+    try:
+        get_sql_connection()
+        work(args.forever, pool)
+    finally:
+        pool.shutdown()
+
+
+def add_subparser(subparsers):
+    parser = subparsers.add_parser('render-worker', help=__description__)
+    parser.add_argument('--forever', action='store_true')
+    parser.set_defaults(func=command)
@@ -3,7 +3,8 @@ import time
 
 from .. import emails
 from ..database import get_sql_connection
-from ..models import Account, Session as SqlSession
+from ..models import Account, Session as SqlSession, \
+    load_account_project_graphs
 
 
 __description__ = 'Send out summary emails.'
@@ -17,6 +18,9 @@ def send_out_emails():
     accounts = session.query(Account) \
         .filter(Account.receive_summary_email == True)  # noqa
     for account in accounts:
+        # held on to so that the summary finds the graphs already loaded
+        projects = load_account_project_graphs(session, account)  # noqa
+
         try:
             email = emails.Summary(account, today)
         except RuntimeError:  # no tasks
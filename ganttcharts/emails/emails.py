@@ -78,7 +78,7 @@ class Summary(Email):
             except chart.CyclicGraphError:
                 continue
 
-            for block in gantt_chart.blocks.values():
+            for block in gantt_chart.blocks_on(today):
                 if block.entry.type.name == 'task' \
                         and block.applies_to(today, account):
                     blocks_today[project].append(block)
@@ -1,5 +1,6 @@
 """Models."""
 
+from collections import defaultdict
 import colorsys
 import datetime
 from enum import Enum
@@ -8,8 +9,9 @@ import os
 
 import flask
 from pandas.tseries.offsets import CustomBusinessDay
-from sqlalchemy import event, Column, String
-from sqlalchemy.orm import backref, scoped_session, sessionmaker, relationship
+from sqlalchemy import event, func, inspect, select, Column, String
+from sqlalchemy.orm import backref, joinedload, object_session, \
+    scoped_session, sessionmaker, subqueryload, relationship
 from sqlalchemy.ext.declarative import declarative_base, DeferredReflection
 from sqlalchemy.ext.hybrid import hybrid_property
 from passlib.context import CryptContext
@@ -29,6 +31,25 @@ password_context = CryptContext(
 )
 
 
+def shared_json(shared, instance, **kwargs):
+    """
+    The JSON of an instance, which is only built once for each shared
+    dictionary it is asked for with, so that a document mentioning the same
+    resource or account many times refers to the one copy of it.
+    """
+
+    if shared is None:
+        return instance.as_json(**kwargs)
+
+    key = (type(instance), instance.id) + tuple(sorted(kwargs.items()))
+
+    try:
+        return shared[key]
+    except KeyError:
+        json = shared[key] = instance.as_json(**kwargs)
+        return json
+
+
 def generate_key(length=512):
     h = hashlib.sha256()
     h.update(os.urandom(length))
@@ -259,13 +280,26 @@ class Project(Base):
         return False
 
     def get_member(self, account):
+        """
+        The project's member for an account, or None if the account is not
+        one. Unless the members are loaded already, this is a single query on
+        the (account, project) index rather than loading all of them.
+        """
+
         try:
             account_id = account.id
         except AttributeError:
             account_id = account
 
+        if 'members' in inspect(self).unloaded:
+            return object_session(self).query(ProjectMember) \
+                .filter(ProjectMember.project_id == self.id) \
+                .filter(ProjectMember.account_id == account_id) \
+                .first()
+
         for member in self.members:
-            if member.account.id == account_id:
+            # a member which is yet to be flushed only has its account
+            if (member.account_id or member.account.id) == account_id:
                 return member
         return None
 
@@ -274,6 +308,54 @@ class Project(Base):
         return [(entry, [dep.child for dep in entry.dependencies])
                 for entry in self.entries]
 
+    @property
+    def content_hash(self):
+        """
+        A hash of everything which affects how the project's Gantt chart
+        looks, which changes whenever the chart would.
+        """
+
+        calendar = self.calendar
+
+        h = hashlib.sha256()
+
+        def update(*values):
+            h.update(repr(values).encode('utf-8'))
+
+        update(self.id, self.name)
+        update(calendar.start_date, calendar.work_starts_at,
+               calendar.work_ends_at, *calendar._weekmask)
+
+        # most of these collections are in whatever order they were loaded
+        # in, so they are sorted to hash the same however that was
+        def by(key, items):
+            return sorted(items, key=lambda item: getattr(item, key))
+
+        for holiday in by('id', calendar.holidays):
+            update('holiday', holiday.start, holiday.end)
+
+        for member in by('id', self.members):
+            update('member', member.id, member.account.id,
+                   member.account.display_name)
+
+        for resource in by('id', self.resources):
+            update('resource', resource.id, resource.name, resource.colour,
+                   resource.amount)
+
+        for entry in by('id', self.entries):
+            update('entry', entry.id, entry.name, entry._type,
+                   entry.normal_time_estimate, entry.min_start_date)
+
+            for dependency in by('child_id', entry.dependencies):
+                update('dependency', dependency.child_id)
+            for entry_resource in by('resource_id', entry.resources):
+                update('resource', entry_resource.resource_id,
+                       entry_resource.amount)
+            for entry_member in by('member_id', entry.members):
+                update('member', entry_member.member_id)
+
+        return h.hexdigest()
+
     def as_json(self):
         return {
             'id': self.id,
@@ -328,6 +410,41 @@ class ProjectCalendar(Base):
     def number_working_days(self):
         return sum([1 if x is True else 0 for x in self._weekmask])
 
+    def non_working_runs(self, start, days):
+        """
+        Find the runs of consecutive non-working days within a number of days
+        from start, as pairs of the offset of the first day of the run from
+        start and the length of the run.
+        """
+
+        if isinstance(start, datetime.datetime):
+            start = start.date()
+
+        holidays = set()
+        for holiday in self.holidays:
+            for i in range((holiday.end - holiday.start).days + 1):
+                holidays.add(holiday.start + datetime.timedelta(days=i))
+
+        weekmask = self._weekmask
+
+        runs = []
+        run_start = None
+
+        for i in range(days):
+            date = start + datetime.timedelta(days=i)
+            working = weekmask[date.weekday()] and date not in holidays
+
+            if working and run_start is not None:
+                runs.append((run_start, i - run_start))
+                run_start = None
+            elif not working and run_start is None:
+                run_start = i
+
+        if run_start is not None:
+            runs.append((run_start, days - run_start))
+
+        return runs
+
     def is_working_date(self, date):
         for holiday in self.holidays:
             if holiday.start <= date.date() <= holiday.end:
@@ -402,15 +519,21 @@ class ProjectMember(Base):
     def access_level(self):
         return self._access_level
 
-    def as_json(self, minimal=False):
-        json = {
-            'id': self.id,
-            'account': self.account.as_json(),
-        }
+    JSON_FIELDS = ('id', 'account', 'access_level')
+
+    def as_json(self, minimal=False, shared=None, fields=None):
+        json = {'id': self.id}
+
+        # the account is only loaded if it is asked for
+        if fields is None or 'account' in fields:
+            json['account'] = shared_json(shared, self.account)
 
         if not minimal:
             json['access_level'] = self.access_level.as_json()
 
+        if fields is not None:
+            json = {name: json[name] for name in fields}
+
         return json
 
 
@@ -423,6 +546,9 @@ class ProjectResource(Base):
         super().__init__(name=name, description=description, icon=icon,
                          amount=amount, reusable=reusable)
 
+    JSON_FIELDS = ('id', 'name', 'description', 'colour', 'icon', 'amount',
+                   'reusable')
+
     def as_json(self):
         return {
             'id': self.id,
@@ -482,8 +608,11 @@ class ProjectEntry(Base):
     def type(self):
         return self._type
 
-    def as_json(self):
-        return {
+    JSON_FIELDS = ('id', 'name', 'description', 'type', 'time_estimates',
+                   'min_start_date', 'dependencies', 'resources', 'members')
+
+    def as_json(self, fields=None, shared=None):
+        json = {
             'id': self.id,
             'name': self.name,
             'description': self.description,
@@ -493,18 +622,34 @@ class ProjectEntry(Base):
                 'pessimistic': self.pessimistic_time_estimate
             },
             'min_start_date': self.min_start_date.isoformat() if self.min_start_date else None,
-            'dependencies': [dep.as_json() for dep in self.dependencies],
-            'resources': [res.as_json() for res in self.resources],
-            'members': [member.as_json() for member in self.members],
         }
 
+        # the links are only loaded if they are asked for
+        if fields is None or 'dependencies' in fields:
+            json['dependencies'] = [dep.as_json() for dep in self.dependencies]
+        if fields is None or 'resources' in fields:
+            json['resources'] = [res.as_json(shared) for res in self.resources]
+        if fields is None or 'members' in fields:
+            json['members'] = [member.as_json(shared)
+                               for member in self.members]
+
+        if fields is not None:
+            json = {name: json[name] for name in fields}
+
+        return json
+
 
 class ProjectEntryDependency(Base):
     __tablename__ = 'project_entry_dependency'
 
-    parent = relationship('ProjectEntry', backref='dependencies',
+    # the database deletes an entry's links along with it, so the session
+    # leaves them alone rather than loading them to delete one by one
+    parent = relationship('ProjectEntry',
+                          backref=backref('dependencies',
+                                          passive_deletes='all'),
                           foreign_keys='ProjectEntryDependency.parent_id')
-    child = relationship('ProjectEntry', backref='dependees',
+    child = relationship('ProjectEntry',
+                         backref=backref('dependees', passive_deletes='all'),
                          foreign_keys='ProjectEntryDependency.child_id')
 
     def as_json(self):
@@ -517,12 +662,14 @@ class ProjectEntryDependency(Base):
 class ProjectEntryMember(Base):
     __tablename__ = 'project_entry_member'
 
-    entry = relationship('ProjectEntry', backref='members')
-    member = relationship('ProjectMember', backref='entries')
+    entry = relationship('ProjectEntry',
+                         backref=backref('members', passive_deletes='all'))
+    member = relationship('ProjectMember',
+                          backref=backref('entries', passive_deletes='all'))
 
-    def as_json(self):
+    def as_json(self, shared=None):
         return {
-            'member': self.member.as_json(minimal=True),
+            'member': shared_json(shared, self.member, minimal=True),
             'entry': {'id': self.entry_id},
         }
 
@@ -530,12 +677,291 @@ class ProjectEntryMember(Base):
 class ProjectEntryResource(Base):
     __tablename__ = 'project_entry_resource'
 
-    entry = relationship('ProjectEntry', backref='resources')
-    resource = relationship('ProjectResource', backref='entries')
+    entry = relationship('ProjectEntry',
+                         backref=backref('resources', passive_deletes='all'))
+    resource = relationship('ProjectResource',
+                            backref=backref('entries', passive_deletes='all'))
 
-    def as_json(self):
+    def as_json(self, shared=None):
         return {
             'amount': self.amount,
-            'resource': self.resource.as_json(),
+            'resource': shared_json(shared, self.resource),
             'entry': {'id': self.entry_id},
         }
+
+
+class ProjectEntryTombstone(Base):
+    __tablename__ = 'project_entry_tombstone'
+
+
+# the Postgres channel each new project revision is announced on, as
+# "<project id>:<revision>"
+REVISIONS_CHANNEL = 'project_revisions'
+
+
+def bump_project_revision(session, project_id):
+    """
+    Move a project on to its next revision, and return it.
+
+    The project's row stays locked until the transaction ends, so revisions
+    are handed out in the order their changes become visible.
+    """
+
+    table = Project.__table__
+
+    session.execute(table.update().where(table.c.id == project_id)
+                    .values(revision=table.c.revision + 1))
+    revision = session.execute(select([table.c.revision])
+                               .where(table.c.id == project_id)).scalar()
+
+    # Postgres tells every process listening about it once the transaction
+    # commits, and not at all if it is rolled back
+    if session.get_bind().dialect.name == 'postgresql':
+        payload = '{}:{}'.format(project_id, revision)
+        session.execute(select([func.pg_notify(REVISIONS_CHANNEL, payload)]))
+
+    return revision
+
+
+def record_entry_changes(session, project_id, changed_ids=(), deleted_ids=()):
+    """
+    Mark entries of a project as changed or deleted at its next revision,
+    returning the revision.
+
+    Changes made through the session are recorded as they are flushed, so
+    this is only needed after bulk statements, which the session never sees.
+    """
+
+    revision = bump_project_revision(session, project_id)
+
+    if changed_ids:
+        table = ProjectEntry.__table__
+        session.execute(table.update().where(table.c.id.in_(changed_ids))
+                        .values(revision=revision))
+
+    if deleted_ids:
+        session.execute(ProjectEntryTombstone.__table__.insert(),
+                        [{'entry_id': entry_id, 'project_id': project_id,
+                          'revision': revision}
+                         for entry_id in deleted_ids])
+
+    # so that whoever is interested can be told once the change is committed
+    session.info.setdefault('revisions', {})[project_id] = revision
+
+    return revision
+
+
+def _changed_entry(instance):
+    """The entry a change to an object shows up in, or its ID."""
+
+    if isinstance(instance, ProjectEntry):
+        return instance
+    elif isinstance(instance, ProjectEntryDependency):
+        return instance.parent_id or instance.parent
+    elif isinstance(instance, (ProjectEntryMember, ProjectEntryResource)):
+        return instance.entry_id or instance.entry
+    else:
+        return None
+
+
+def _linked_entry_ids(session, instance):
+    """The IDs of the entries a member or resource is linked to."""
+
+    if isinstance(instance, ProjectMember):
+        query = session.query(ProjectEntryMember.entry_id) \
+            .filter(ProjectEntryMember.member_id == instance.id)
+    else:
+        query = session.query(ProjectEntryResource.entry_id) \
+            .filter(ProjectEntryResource.resource_id == instance.id)
+
+    with session.no_autoflush:
+        return [entry_id for entry_id, in query]
+
+
+def _changed_project(instance):
+    """
+    The ID of the project a change to something other than its entries
+    shows up in, or None.
+    """
+
+    if isinstance(instance, Project):
+        return instance.id
+    elif isinstance(instance, (ProjectCalendar, ProjectMember,
+                               ProjectResource)):
+        return instance.project_id or \
+            (instance.project is not None and instance.project.id)
+    elif isinstance(instance, ProjectCalendarHoliday):
+        return instance.calendar_id or \
+            (instance.calendar is not None and instance.calendar.project_id)
+    else:
+        return None
+
+
+@event.listens_for(Session, 'before_flush')
+def record_revisions(session, flush_context, instances):
+    """
+    Give every entry changed by a flush, including through its dependencies,
+    resources or members, its project's next revision, and leave a
+    tombstone for every entry deleted by it. Changes to the rest of a
+    project, such as its calendar, move it on to its next revision too.
+    """
+
+    changed = defaultdict(set)
+    changed_ids = set()
+    deleted = defaultdict(set)
+    changed_projects = set()
+
+    for instance in session.new | session.dirty | session.deleted:
+        if instance in session.dirty and not session.is_modified(instance):
+            continue
+
+        # a new project starts at revision 0, and a deleted one has none
+        if not (isinstance(instance, Project) and instance in session.deleted):
+            project_id = _changed_project(instance)
+            if project_id:
+                changed_projects.add(project_id)
+
+        # the database deletes a member's or resource's links to entries
+        # along with it, which the session never sees
+        if instance in session.deleted and \
+                isinstance(instance, (ProjectMember, ProjectResource)):
+            changed_ids.update(_linked_entry_ids(session, instance))
+            continue
+
+        entry = _changed_entry(instance)
+        if entry is None:
+            continue
+
+        if isinstance(entry, int):
+            changed_ids.add(entry)
+            continue
+
+        project_id = entry.project_id
+        if project_id is None and entry.project is not None:
+            project_id = entry.project.id
+
+        # a new project starts at revision 0, entries and all
+        if project_id is None:
+            continue
+
+        if instance in session.deleted and instance is entry:
+            deleted[project_id].add(entry.id)
+        else:
+            changed[project_id].add(entry)
+
+    if changed_ids:
+        with session.no_autoflush:
+            query = session.query(ProjectEntry.id, ProjectEntry.project_id) \
+                .filter(ProjectEntry.id.in_(changed_ids))
+            entry_projects = dict(query)
+    else:
+        entry_projects = {}
+
+    for project_id in set(changed) | set(deleted) | \
+            set(entry_projects.values()) | changed_projects:
+        ids = [entry_id for entry_id, entry_project_id
+               in entry_projects.items() if entry_project_id == project_id]
+
+        revision = record_entry_changes(session, project_id, ids,
+                                        deleted[project_id])
+
+        for entry in changed[project_id]:
+            entry.revision = revision
+
+
+def delete_entries(session, project_id, entry_ids):
+    """
+    Delete entries of a project with a single statement, however many there
+    are, and return the IDs of the other entries which changed as a result.
+
+    The database deletes their dependencies, resources and members along
+    with them. Bulk statements go around the session, so the caller records
+    the changes, usually along with others it made.
+    """
+
+    entry_ids = list(entry_ids)
+    if not entry_ids:
+        return []
+
+    # an entry lists the entries depending on it, which change as well
+    parents = session.query(ProjectEntryDependency.parent_id) \
+        .filter(ProjectEntryDependency.child_id.in_(entry_ids)) \
+        .filter(~ProjectEntryDependency.parent_id.in_(entry_ids)) \
+        .distinct()
+    changed_ids = [parent_id for parent_id, in parents]
+
+    session.query(ProjectEntry) \
+        .filter(ProjectEntry.project_id == project_id) \
+        .filter(ProjectEntry.id.in_(entry_ids)) \
+        .delete(synchronize_session=False)
+
+    return changed_ids
+
+
+def delete_project(session, project_id):
+    """
+    Delete a project with a single statement, the database deleting
+    everything belonging to it along with it.
+    """
+
+    session.query(Project).filter(Project.id == project_id) \
+        .delete(synchronize_session=False)
+
+
+def project_graph_options():
+    """
+    Query options which load everything a project's chart is scheduled from
+    along with the project, in a fixed number of queries however big it is.
+
+    Each collection is loaded with a subquery, as SQLAlchemy 1.0 has no
+    "select in" loading, and single objects are joined in. The many-to-one
+    links back into the graph (e.g. a dependency's child, or an entry's
+    member) then come straight out of the session's identity map.
+    """
+
+    return [
+        joinedload('calendar').subqueryload('holidays'),
+        subqueryload('members').joinedload('account'),
+        subqueryload('resources'),
+        subqueryload('entries').subqueryload('dependencies'),
+        subqueryload('entries').subqueryload('dependees'),
+        subqueryload('entries').subqueryload('resources'),
+        subqueryload('entries').subqueryload('members'),
+    ]
+
+
+def entry_options(fields=None):
+    """
+    Query options which load everything an entry's JSON is made from along
+    with the entries themselves, or just what the given fields are.
+    """
+
+    options = {
+        'dependencies': subqueryload('dependencies'),
+        'resources': subqueryload('resources').joinedload('resource'),
+        'members': subqueryload('members').joinedload('member')
+            .joinedload('account'),
+    }
+
+    return [option for name, option in options.items()
+            if fields is None or name in fields]
+
+
+def load_project_graph(session, project_id):
+    """Fetch a project with its whole graph, or raise NoResultFound."""
+    return session.query(Project).options(*project_graph_options()) \
+        .filter(Project.id == project_id).one()
+
+
+def load_account_project_graphs(session, account):
+    """
+    Fetch the projects an account is a member of, with their whole graphs.
+
+    The session only holds on to objects weakly, so keep the returned list
+    for as long as the projects are being used through the account.
+    """
+
+    return session.query(Project).options(*project_graph_options()) \
+        .join(ProjectMember).filter(ProjectMember.account_id == account.id) \
+        .all()
+
@@ -0,0 +1,10 @@
+from .cache import *
+from .admission import *
+from .compression import *
+from .queue import *
+from .svg import *
+from .png import *
+from .pdf import *
+from .tiles import *
+from .exports import *
+from .thumbnails import *
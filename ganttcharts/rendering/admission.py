@@ -0,0 +1,144 @@
+"""
+Admission control for renderings, shared by every process using the render
+cache.
+
+A rendering which is already being produced is waited for rather than
+produced again, and only so many renderings are produced at once. A request
+which cannot get its turn in time is turned away rather than tying up a
+worker. Both are done with locks on files next to the cache, which the
+operating system releases if a process dies holding them.
+"""
+
+import fcntl
+import math
+import os
+import time
+
+from .cache import get_render_cache
+
+
+__all__ = ['Busy', 'Admission', 'get_admission']
+
+
+CONCURRENCY_KEY = 'RENDER_CONCURRENCY'
+TIMEOUT_KEY = 'RENDER_TIMEOUT'
+
+DEFAULT_TIMEOUT = 10
+
+# keys share this many lock files by their first characters, so there are
+# never more lock files than this however many keys there are
+FLIGHT_LOCKS = 256
+
+POLL_INTERVAL = 0.05
+
+
+_admission = None
+
+
+class Busy(Exception):
+    """There was no turn to render within the timeout."""
+
+    def __init__(self, retry_after):
+        super().__init__('Timed out waiting for a turn to render.')
+        self.retry_after = retry_after
+
+
+class Lock:
+    """
+    A lock held on a file, released when it is, or when the lock is
+    garbage collected.
+    """
+
+    def __init__(self, file):
+        self._file = file
+
+    def release(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class Admission:
+    """
+    Turns to render, and to wait for renderings someone else is producing.
+
+    The number of renderings produced at once across all processes defaults
+    to the number of CPUs, and requests wait up to ten seconds for a turn.
+    """
+
+    def __init__(self, directory=None, concurrency=None, timeout=None):
+        if directory is None:
+            directory = os.path.join(get_render_cache().directory, '.locks')
+
+        if concurrency is None:
+            concurrency = int(os.environ.get(CONCURRENCY_KEY,
+                                             os.cpu_count() or 1))
+
+        if timeout is None:
+            timeout = float(os.environ.get(TIMEOUT_KEY, DEFAULT_TIMEOUT))
+
+        self.directory = directory
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def retry_after(self):
+        """How many seconds a client turned away should wait to try again."""
+        return max(1, math.ceil(self.timeout))
+
+    def _acquire(self, names):
+        """Lock whichever of some files comes free first, or raise Busy."""
+
+        files = [open(os.path.join(self.directory, name), 'a')
+                 for name in names]
+        deadline = time.monotonic() + self.timeout
+
+        try:
+            while True:
+                for file in files:
+                    try:
+                        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue
+
+                    files.remove(file)
+                    return Lock(file)
+
+                if time.monotonic() >= deadline:
+                    raise Busy(self.retry_after)
+
+                time.sleep(POLL_INTERVAL)
+        finally:
+            for file in files:
+                file.close()
+
+    def flight(self, key):
+        """
+        The turn to produce the rendering with a key, which is only given out
+        once whoever had it last is done, so they can look in the cache for
+        it first.
+        """
+
+        index = int(key[:8], 16) % FLIGHT_LOCKS
+        return self._acquire(['flight-{}'.format(index)])
+
+    def slot(self):
+        """A turn at producing a rendering, out of a limited number."""
+
+        return self._acquire(['slot-{}'.format(index)
+                              for index in range(self.concurrency)])
+
+
+def get_admission():
+    global _admission
+
+    if _admission is None:
+        _admission = Admission()
+
+    return _admission
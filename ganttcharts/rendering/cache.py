@@ -0,0 +1,202 @@
+"""A cache of rendered charts, kept on the local disk."""
+
+import datetime
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+
+__all__ = ['RenderCache', 'get_render_cache']
+
+
+DIRECTORY_KEY = 'RENDER_CACHE_DIR'
+MAX_SIZE_KEY = 'RENDER_CACHE_MAX_SIZE'
+
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+_render_cache = None
+
+
+class RenderCache:
+    """
+    Rendered documents stored as files named after a key, which is a hash of
+    everything that went into rendering them.
+
+    The cache is bounded in size, evicting the least recently used files
+    first. Each file's modification time records when it was rendered, and
+    its access time when it was last used.
+
+    Rather than looking through the whole cache on every write, each process
+    keeps a running total of the size it last found plus what it has written
+    since, and only evicts once that goes over the limit. Writes by other
+    processes are not counted, so the render worker also evicts now and
+    then to catch up with them.
+    """
+
+    def __init__(self, directory=None, max_size=None):
+        if directory is None:
+            directory = os.environ.get(DIRECTORY_KEY)
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(),
+                                     'ganttcharts-render-cache')
+
+        if max_size is None:
+            max_size = int(os.environ.get(MAX_SIZE_KEY, DEFAULT_MAX_SIZE))
+
+        self.directory = directory
+        self.max_size = max_size
+
+        # the size of the cache as far as this process knows, or None until
+        # it has been looked at
+        self._size = None
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """Produce a key from the inputs to a rendering."""
+
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(repr(part).encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    @staticmethod
+    def variant(key, encoding):
+        """The key of a rendering compressed with a content coding."""
+
+        if encoding is None:
+            return key
+        else:
+            return '{}.{}'.format(key, encoding)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Fetch a rendering, or None if it is not in the cache."""
+
+        path = self.path(key)
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            stat = os.stat(path)
+            os.utime(path, (time.time(), stat.st_mtime))
+        except FileNotFoundError:  # evicted in the meantime
+            pass
+
+        return data
+
+    def last_modified(self, key):
+        """When a rendering was put into the cache."""
+
+        try:
+            mtime = os.stat(self.path(key)).st_mtime
+        except FileNotFoundError:
+            return None
+
+        return datetime.datetime.utcfromtimestamp(int(mtime))
+
+    def _open_temporary(self):
+        return tempfile.NamedTemporaryFile(dir=self.directory, prefix='.',
+                                           delete=False)
+
+    def _commit(self, temporary, key):
+        size = temporary.tell()
+        temporary.close()
+        os.replace(temporary.name, self.path(key))
+
+        if self._size is None:
+            self.evict()
+        else:
+            self._size += size
+            if self._size > self.max_size:
+                self.evict()
+
+    def put(self, key, data):
+        temporary = self._open_temporary()
+        try:
+            temporary.write(data)
+        except BaseException:
+            temporary.close()
+            os.remove(temporary.name)
+            raise
+
+        self._commit(temporary, key)
+
+    def tee(self, key, chunks, encoding='utf-8'):
+        """
+        Pass through chunks of a rendering as they are produced, storing it
+        once it is complete.
+
+        Nothing is stored if the rendering is abandoned part of the way
+        through.
+        """
+
+        temporary = self._open_temporary()
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(encoding)
+                temporary.write(chunk)
+                yield chunk
+        except BaseException:
+            temporary.close()
+            os.remove(temporary.name)
+            raise
+        else:
+            self._commit(temporary, key)
+
+    def evict(self):
+        """Remove the least recently used files until the cache fits."""
+
+        entries = []
+        total_size = 0
+
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+
+            entries.append((stat.st_atime, stat.st_size, name))
+            total_size += stat.st_size
+
+        entries.sort()
+
+        while total_size > self.max_size and entries:
+            _, size, name = entries.pop(0)
+
+            logger.debug('Evicting %s from the render cache.', name)
+
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+            total_size -= size
+
+        self._size = total_size
+
+
+def get_render_cache():
+    global _render_cache
+
+    if _render_cache is None:
+        _render_cache = RenderCache()
+
+    return _render_cache
@@ -0,0 +1,84 @@
+"""Compression of rendered documents for sending over HTTP."""
+
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+__all__ = ['available_encodings', 'negotiate_encoding', 'is_compressible',
+           'compress', 'compress_stream']
+
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = (
+    'application/json',
+    'application/vnd.ganttcharts.compact+json',
+    'application/vnd.ganttcharts.schedule',
+    'image/svg+xml',
+)
+
+
+def available_encodings():
+    """The content codings that can be produced, best first."""
+
+    if brotli is None:
+        return ('gzip',)
+    else:
+        return ('br', 'gzip')
+
+
+def negotiate_encoding(accept_encodings):
+    """
+    Choose a content coding from a request's Accept-Encoding header, or None
+    if the response should not be compressed.
+    """
+
+    encodings = [encoding for encoding in available_encodings()
+                 if accept_encodings.quality(encoding) > 0]
+    return accept_encodings.best_match(encodings)
+
+
+def is_compressible(mimetype):
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def _compressor(encoding):
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        return compressor.compress, compressor.flush
+    elif encoding == 'br' and brotli is not None:
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    else:
+        raise ValueError('Unknown content coding: {}.'.format(encoding))
+
+
+def compress(data, encoding):
+    process, finish = _compressor(encoding)
+    return process(data) + finish()
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compress chunks of a document as they are produced.
+
+    Empty chunks are held back, as a compressor usually buffers its input
+    until it has enough to produce a block.
+    """
+
+    process, finish = _compressor(encoding)
+
+    for chunk in chunks:
+        chunk = process(chunk)
+        if chunk:
+            yield chunk
+
+    chunk = finish()
+    if chunk:
+        yield chunk
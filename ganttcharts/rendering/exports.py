@@ -0,0 +1,36 @@
+"""Rendering of Gantt charts into downloadable files."""
+
+from .cache import RenderCache
+from .pdf import render_pdf, render_raster_pdf
+from .png import render_png
+
+
+__all__ = ['EXPORT_FORMATS', 'export_key', 'render_export']
+
+
+EXPORT_FORMATS = ('pdf', 'png')
+
+
+def export_key(project, format, raster=False, zoom='hour'):
+    """The render cache key of an export."""
+    return RenderCache.key(project.content_hash, 'export', format, raster,
+                           zoom)
+
+
+def render_export(chart, project, format, raster=False, zoom='hour',
+                  pool=None):
+    """
+    Render an export. The zoom level only applies to rasterised exports, as
+    the vector PDF has a layout of its own. The pages of a raster PDF are
+    rasterised in the pool of processes, if one is given.
+    """
+
+    if format == 'pdf':
+        if raster:
+            return render_raster_pdf(chart, project, zoom=zoom, pool=pool)
+        else:
+            return render_pdf(chart, project)
+    elif format == 'png':
+        return render_png(chart, project, zoom=zoom)
+    else:
+        raise ValueError('Unknown export format: {}.'.format(format))
@@ -0,0 +1,377 @@
+"""Rendering of Gantt charts as PDF documents."""
+
+import datetime
+import io
+import math
+import re
+
+import reportlab.lib.colors
+import reportlab.lib.pagesizes
+import reportlab.lib.utils
+import reportlab.pdfbase.pdfmetrics
+import reportlab.pdfgen.canvas
+
+from .png import svg_to_png
+from .svg import Layout, Viewport, render_svg
+
+
+__all__ = ['render_pdf', 'render_raster_pdf']
+
+
+PAGE_SIZE = tuple(reversed(reportlab.lib.pagesizes.A4))
+PAGE_MARGIN = 50
+TITLE_HEIGHT = 50
+
+ROW_HEIGHT = 16
+HOUR_WIDTH = 1.5
+HEADER_HEIGHT = 40
+MAX_NAME_COLUMN_FRACTION = 0.3
+
+FONT = 'Helvetica'
+FONT_BOLD = 'Helvetica-Bold'
+FONT_SIZE = 8
+
+VERY_LIGHT_GREY = reportlab.lib.colors.Color(240 / 255, 240 / 255, 240 / 255)
+LIGHT_GREY = reportlab.lib.colors.Color(210 / 255, 210 / 255, 210 / 255)
+DARK_GREY = reportlab.lib.colors.Color(140 / 255, 140 / 255, 140 / 255)
+
+_rgb_pattern = re.compile(r'rgb\((\d+),\s*(\d+),\s*(\d+)\)')
+
+
+def _colour(string):
+    """Convert a CSS ``rgb(r, g, b)`` colour as used by the models."""
+
+    match = _rgb_pattern.match(string)
+    if match is None:
+        return reportlab.lib.colors.HexColor(string)
+
+    r, g, b = (int(x) / 255 for x in match.groups())
+    return reportlab.lib.colors.Color(r, g, b)
+
+
+def _draw_title_header(canvas, chart, project):
+    x = PAGE_SIZE[0] / 2
+    y = PAGE_SIZE[1] - PAGE_MARGIN
+    title1 = 'Gantt Chart for {}'.format(project.name)
+    title2 = '{} to {}'.format(chart.start.date(), chart.end.date())
+    canvas.setFont(FONT, 14)
+    canvas.drawCentredString(x, y - 10, title1)
+    canvas.setFont(FONT, 10)
+    canvas.drawCentredString(x, y - 25, title2)
+
+
+class _Page:
+    """
+    One page of the chart, showing a viewport onto it.
+
+    Coordinates are measured in points from the top left corner of the grid,
+    increasing downwards, and converted to reportlab's coordinates as they
+    are drawn.
+    """
+
+    def __init__(self, canvas, chart, viewport, name_column_width):
+        self.canvas = canvas
+        self.chart = chart
+        self.viewport = viewport
+        self.calendar = chart.project.calendar
+
+        self.day_width = HOUR_WIDTH * self.calendar.business_day_length
+
+        self.left = PAGE_MARGIN + name_column_width
+        self.top = PAGE_SIZE[1] - PAGE_MARGIN - TITLE_HEIGHT - HEADER_HEIGHT
+
+        self.name_column_width = name_column_width
+        self.width = self.day_width * len(viewport.columns)
+        self.height = ROW_HEIGHT * (viewport.last_row - viewport.first_row + 1)
+
+    def x(self, hours):
+        first_hour = self.viewport.first_day \
+            * self.calendar.business_day_length
+        return self.left + (hours - first_hour) * HOUR_WIDTH
+
+    def y(self, row):
+        return self.top - (row - self.viewport.first_row) * ROW_HEIGHT
+
+    def draw(self):
+        self.draw_entry_names()
+        self.draw_day_headings()
+
+        self.canvas.saveState()
+
+        path = self.canvas.beginPath()
+        path.rect(self.left, self.top - self.height, self.width, self.height)
+        self.canvas.clipPath(path, stroke=0, fill=0)
+
+        self.draw_non_working_days()
+        self.draw_grid()
+        self.draw_milestone_lines()
+        self.draw_dependencies()
+        self.draw_blocks()
+
+        self.canvas.restoreState()
+
+    def draw_entry_names(self):
+        canvas = self.canvas
+
+        canvas.setFont(FONT, FONT_SIZE)
+        canvas.setStrokeColor(LIGHT_GREY)
+        canvas.setLineWidth(0.5)
+
+        for block in self.viewport.rows:
+            y = self.y(block.index + 1)
+            canvas.setFillColor(reportlab.lib.colors.black)
+            canvas.drawRightString(self.left - 4, y + 5, block.entry.name)
+            canvas.line(PAGE_MARGIN, y, self.left, y)
+
+    def draw_day_headings(self):
+        canvas = self.canvas
+
+        canvas.setFont(FONT, FONT_SIZE - 1)
+        canvas.setFillColor(reportlab.lib.colors.black)
+
+        for i, day in self.viewport.days:
+            if i % 3 != 0:
+                continue
+
+            canvas.saveState()
+            canvas.translate(self.x(i * self.calendar.business_day_length),
+                             self.top + 2)
+            canvas.rotate(30)
+            canvas.drawString(0, 0, day.strftime('%a %-d %b %Y'))
+            canvas.restoreState()
+
+    def draw_non_working_days(self):
+        canvas = self.canvas
+        canvas.setFillColor(VERY_LIGHT_GREY)
+
+        for i, length in self.viewport.non_working_runs:
+            x = self.x(i * self.calendar.business_day_length)
+            canvas.rect(x, self.top - self.height, self.day_width * length,
+                        self.height, stroke=0, fill=1)
+
+    def draw_grid(self):
+        canvas = self.canvas
+        canvas.setLineWidth(0.5)
+
+        canvas.setStrokeColor(LIGHT_GREY)
+        for row in range(self.viewport.first_row,
+                         self.viewport.last_row + 2):
+            y = self.y(row)
+            canvas.line(self.left, y, self.left + self.width, y)
+
+        canvas.setStrokeColor(DARK_GREY)
+        for i in self.viewport.columns:
+            x = self.x(i * self.calendar.business_day_length)
+            canvas.line(x, self.top, x, self.top - self.height)
+
+    def draw_milestone_lines(self):
+        canvas = self.canvas
+        canvas.setLineWidth(1)
+
+        for block in self.viewport.milestones:
+            x = self.x(block.left_cells + block.cells)
+            canvas.setStrokeColor(_colour(block.stroke_colour))
+            canvas.line(x, self.top, x, self.top - self.height)
+
+    def draw_dependencies(self):
+        canvas = self.canvas
+        canvas.setLineWidth(1)
+
+        for block, dependee_block in self.viewport.dependencies:
+            colour = _colour(block.stroke_colour)
+            canvas.setStrokeColor(colour)
+            canvas.setFillColor(colour)
+
+            y = self.y(block.index) - ROW_HEIGHT / 2
+            x1 = self.x(block.left_cells + block.cells)
+            x2 = self.x(dependee_block.left_cells) + 3
+            y2 = self.y(dependee_block.index)
+
+            canvas.line(x1, y, x2, y)
+            canvas.line(x2, y, x2, y2 + 3)
+
+            path = canvas.beginPath()
+            path.moveTo(x2 - 2, y2 + 3)
+            path.lineTo(x2 + 2, y2 + 3)
+            path.lineTo(x2, y2)
+            path.close()
+            canvas.drawPath(path, stroke=0, fill=1)
+
+    def draw_blocks(self):
+        canvas = self.canvas
+
+        for block in self.viewport.blocks:
+            top = self.y(block.index)
+            bottom = top - ROW_HEIGHT
+            left = self.x(block.left_cells)
+            right = self.x(block.left_cells + block.cells)
+
+            canvas.setLineWidth(0.5)
+            canvas.setStrokeColor(DARK_GREY)
+            canvas.setFillColor(_colour(block.fill_colour))
+
+            if block.entry.type.name == 'task':
+                canvas.rect(left, bottom, right - left, ROW_HEIGHT, stroke=1,
+                            fill=1)
+
+                name = block.entry.name
+                name_width = reportlab.pdfbase.pdfmetrics.stringWidth(
+                    name, FONT, FONT_SIZE)
+                if name_width + 8 < right - left:
+                    canvas.setFont(FONT, FONT_SIZE)
+                    canvas.setFillColor(reportlab.lib.colors.black)
+                    canvas.drawString(left + 4, bottom + 5, name)
+
+                self.draw_block_overlay(block.entry, right - 1, bottom)
+            elif block.entry.type.name == 'milestone':
+                size = ROW_HEIGHT * 0.5
+                middle = bottom + ROW_HEIGHT / 2
+
+                if block.length >= 1:
+                    canvas.setLineWidth(1)
+                    canvas.setStrokeColor(_colour(block.stroke_colour))
+                    canvas.line(left, bottom + 2, left, top - 2)
+                    canvas.line(left, middle, right, middle)
+
+                canvas.setLineWidth(0.5)
+                canvas.setStrokeColor(DARK_GREY)
+
+                path = canvas.beginPath()
+                path.moveTo(right, middle + size)
+                path.lineTo(right + size, middle)
+                path.lineTo(right, middle - size)
+                path.lineTo(right - size, middle)
+                path.close()
+                canvas.drawPath(path, stroke=1, fill=1)
+
+    def draw_block_overlay(self, entry, right, bottom):
+        """
+        Draw resource swatches and member avatars leftwards from the end of a
+        block, as the SVG does.
+        """
+
+        canvas = self.canvas
+        size = ROW_HEIGHT - 2
+        x = right
+
+        for entry_resource in reversed(entry.resources):
+            width = HOUR_WIDTH * entry_resource.amount
+            x -= width
+            canvas.setFillColor(_colour(entry_resource.resource.colour))
+            canvas.rect(x, bottom + 1, width, size, stroke=0, fill=1)
+            x -= 1
+
+        for entry_member in reversed(entry.members):
+            account = entry_member.member.account
+            x -= size
+            canvas.setFillColor(_colour(account.colour))
+            canvas.rect(x, bottom + 1, size, size, stroke=0, fill=1)
+            canvas.setFillColor(reportlab.lib.colors.white)
+            canvas.setFont(FONT_BOLD, size * 0.5)
+            canvas.drawCentredString(x + size / 2, bottom + 1 + size * 0.3,
+                                     account.initials)
+            x -= 1
+
+
+def render_pdf(chart, project):
+    """
+    Draw the chart as vector graphics, split into pages by rows and by days.
+    """
+
+    output = io.BytesIO()
+    canvas = reportlab.pdfgen.canvas.Canvas(output, pagesize=PAGE_SIZE)
+
+    longest_name = max(
+        reportlab.pdfbase.pdfmetrics.stringWidth(block.entry.name, FONT,
+                                                 FONT_SIZE)
+        for block in chart.blocks.values())
+
+    chart_width = PAGE_SIZE[0] - 2 * PAGE_MARGIN
+    chart_height = PAGE_SIZE[1] - 2 * PAGE_MARGIN - TITLE_HEIGHT \
+        - HEADER_HEIGHT
+
+    name_column_width = min(longest_name + 8,
+                            chart_width * MAX_NAME_COLUMN_FRACTION)
+
+    day_width = HOUR_WIDTH * project.calendar.business_day_length
+    days_per_page = max(int((chart_width - name_column_width) // day_width),
+                        1)
+    rows_per_page = max(int(chart_height // ROW_HEIGHT), 1)
+
+    full = Viewport(chart)
+    chart_date = chart.start.date()
+
+    for first_row in range(0, full.last_row + 1, rows_per_page):
+        for first_day in range(0, full.last_day + 1, days_per_page):
+            start = chart_date + datetime.timedelta(days=first_day)
+            end = start + datetime.timedelta(days=days_per_page - 1)
+            viewport = Viewport(chart, first_row,
+                                first_row + rows_per_page - 1, start, end)
+
+            _draw_title_header(canvas, chart, project)
+            _Page(canvas, chart, viewport, name_column_width).draw()
+            canvas.showPage()
+
+    canvas.save()
+
+    pdf = output.getvalue()
+    output.close()
+
+    return pdf
+
+
+def render_raster_pdf(chart, project, today=None, zoom='hour', pool=None):
+    """
+    Rasterise the SVG rendering of the chart and split it across pages.
+
+    This is slower and blurrier than ``render_pdf``, but matches the SVG
+    exactly. Each page is a separate viewport onto the chart, scaled to fit
+    the height of the page. Given a pool of processes (as the render worker
+    has), the pages are rasterised in parallel, and otherwise one at a time.
+    """
+
+    chart_x = PAGE_MARGIN
+    chart_y = PAGE_MARGIN
+    chart_width = int(PAGE_SIZE[0] - chart_x - PAGE_MARGIN)
+    chart_height = int(PAGE_SIZE[1] - chart_y - PAGE_MARGIN - TITLE_HEIGHT)
+
+    layout = Layout(chart, project, zoom)
+
+    scale = chart_height / layout.full_height
+    page_width = chart_width / scale
+    no_pages = math.ceil(layout.full_width / page_width)
+
+    chart_date = chart.start.date()
+
+    svgs = []
+    for i in range(no_pages):
+        left = i * page_width
+        start = chart_date + datetime.timedelta(days=layout.column_at(left))
+        end = chart_date + datetime.timedelta(
+            days=layout.column_at(left + page_width))
+
+        viewport = Viewport(chart, start=start, end=end,
+                            bounds=(left, 0, page_width, layout.full_height),
+                            size=(chart_width, chart_height))
+        svgs.append(render_svg(chart, project, today=today,
+                               viewport=viewport, zoom=zoom))
+
+    output = io.BytesIO()
+    canvas = reportlab.pdfgen.canvas.Canvas(output, pagesize=PAGE_SIZE)
+
+    pngs = map(svg_to_png, svgs) if pool is None \
+        else pool.map(svg_to_png, svgs)
+
+    for png in pngs:
+        canvas.drawImage(reportlab.lib.utils.ImageReader(io.BytesIO(png)),
+                         chart_x, chart_y, width=chart_width,
+                         height=chart_height)
+        _draw_title_header(canvas, chart, project)
+        canvas.showPage()
+
+    canvas.save()
+
+    pdf = output.getvalue()
+    output.close()
+
+    return pdf
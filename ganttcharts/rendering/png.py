@@ -0,0 +1,21 @@
+"""Rendering of Gantt charts as PNG images."""
+
+import cairocffi
+cairocffi.install_as_pycairo()
+import cairosvg
+
+from .svg import render_svg
+
+
+__all__ = ['render_png', 'svg_to_png']
+
+
+def svg_to_png(svg):
+    """Rasterise an SVG document."""
+    return cairosvg.svg2png(svg.encode('utf-8'))
+
+
+def render_png(chart, project, today=None, viewport=None, zoom='hour'):
+    svg = render_svg(chart, project, today=today, viewport=viewport,
+                     zoom=zoom)
+    return svg_to_png(svg)
@@ -0,0 +1,161 @@
+"""A queue of export jobs, kept on the local disk."""
+
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+
+__all__ = ['RenderQueue', 'get_render_queue']
+
+
+DIRECTORY_KEY = 'RENDER_QUEUE_DIR'
+
+STATES = ('pending', 'running', 'done', 'failed')
+
+logger = logging.getLogger(__name__)
+
+
+_render_queue = None
+
+
+class RenderQueue:
+    """
+    Export jobs stored as JSON files, which move between one directory per
+    state as they are worked on.
+
+    Moving a file is atomic, so any number of web processes can submit jobs
+    and any number of workers can claim them without a separate broker.
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.environ.get(DIRECTORY_KEY)
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(),
+                                     'ganttcharts-render-queue')
+
+        self.directory = directory
+
+        for state in STATES:
+            os.makedirs(os.path.join(self.directory, state), exist_ok=True)
+
+    def _path(self, state, job_id):
+        return os.path.join(self.directory, state, job_id + '.json')
+
+    def _write(self, state, job):
+        with tempfile.NamedTemporaryFile('w', dir=self.directory,
+                                         prefix='.', delete=False) as f:
+            json.dump(job, f)
+        os.replace(f.name, self._path(state, job['id']))
+
+    def submit(self, job_id=None, **job):
+        """
+        Add a job to the queue, returning it with its ID.
+
+        If a job ID is given and that job is already waiting or being worked
+        on, the existing job is returned instead of adding another.
+        """
+
+        if job_id is not None:
+            existing = self.get(job_id)
+            if existing is not None \
+                    and existing['state'] in ('pending', 'running'):
+                return existing
+        else:
+            job_id = uuid.uuid4().hex
+
+        job['id'] = job_id
+        job['state'] = 'pending'
+        self._write('pending', job)
+
+        logger.info('Submitted render job %s.', job['id'])
+
+        return job
+
+    def get(self, job_id):
+        """Look up a job, or return None if there is no such job."""
+
+        for state in STATES:
+            try:
+                with open(self._path(state, job_id)) as f:
+                    job = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+
+            job['state'] = state
+            return job
+
+        return None
+
+    def claim(self):
+        """Take the oldest pending job, or return None if there are none."""
+
+        pending = os.path.join(self.directory, 'pending')
+
+        names = []
+        for name in os.listdir(pending):
+            try:
+                names.append((os.stat(os.path.join(pending, name)).st_mtime,
+                              name))
+            except FileNotFoundError:
+                continue
+
+        for _, name in sorted(names):
+            job_id = name[:-len('.json')]
+
+            try:
+                os.rename(self._path('pending', job_id),
+                          self._path('running', job_id))
+            except FileNotFoundError:  # another worker got there first
+                continue
+
+            job = self.get(job_id)
+            if job is not None:
+                return job
+
+        return None
+
+    def _finish(self, job, state):
+        job['state'] = state
+        self._write(state, job)
+
+        try:
+            os.remove(self._path('running', job['id']))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, job, key):
+        """Mark a job as done, with the render cache key of its result."""
+        job['key'] = key
+        self._finish(job, 'done')
+
+    def fail(self, job, message):
+        job['error'] = message
+        self._finish(job, 'failed')
+
+    def prune(self, max_age=24 * 60 * 60):
+        """Forget about finished jobs older than max_age seconds."""
+
+        now = time.time()
+
+        for state in ('done', 'failed'):
+            directory = os.path.join(self.directory, state)
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    if now - os.stat(path).st_mtime > max_age:
+                        os.remove(path)
+                except FileNotFoundError:
+                    continue
+
+
+def get_render_queue():
+    global _render_queue
+
+    if _render_queue is None:
+        _render_queue = RenderQueue()
+
+    return _render_queue
@@ -0,0 +1,432 @@
+"""Rendering of Gantt charts as SVG documents."""
+
+from collections import OrderedDict
+import datetime
+import math
+
+import flask
+from werkzeug.utils import cached_property
+
+
+__all__ = ['ZOOM_LEVELS', 'Layout', 'Viewport', 'render_svg', 'generate_svg']
+
+
+TEMPLATE_NAME = 'projects/gantt-chart.svg'
+
+CHUNK_SIZE = 16 * 1024
+
+
+ZOOM_LEVELS = ('hour', 'day', 'week', 'month')
+
+# the grid extends this many days beyond the end of the chart
+PADDING_DAYS = 6
+
+
+class Layout:
+    """
+    The sizes of everything in the SVG rendering of a chart.
+
+    At the ``hour`` zoom level every working hour has a column of its own. At
+    the coarser levels the timeline is divided into one column per day, week
+    (starting on a Monday) or month, and blocks are snapped outwards to the
+    edges of the columns they fall in.
+    """
+
+    block_height = 30
+    block_text_dy = -9
+    milestone_size = 21
+
+    char_width = 8.5
+
+    hourly_column_width = 2
+    daily_column_height = 80
+
+    zoom_column_widths = {'day': 8, 'week': 16, 'month': 48}
+
+    # how many columns there are between each heading
+    heading_intervals = {'hour': 3, 'day': 6, 'week': 3, 'month': 1}
+    heading_formats = {
+        'hour': '%a %-d %b %Y',
+        'day': '%a %-d %b %Y',
+        'week': '%-d %b %Y',
+        'month': '%b %Y',
+    }
+
+    def __init__(self, chart, project, zoom='hour'):
+        if zoom not in ZOOM_LEVELS:
+            raise ValueError('Unknown zoom level: {}.'.format(zoom))
+
+        self.chart = chart
+        self.project = project
+        self.zoom = zoom
+
+        self.business_day_length = project.calendar.business_day_length
+
+        max_entry_name = chart.max_entry_name if chart else 1
+        self.entry_name_column_width = \
+            int(math.ceil(max_entry_name * self.char_width + 12))
+        self.entry_name_column_height = self.block_height
+
+        self.daily_column_width = self.hourly_column_width \
+            * self.business_day_length
+
+        if zoom == 'hour':
+            self.column_width = self.daily_column_width
+        else:
+            self.column_width = self.zoom_column_widths[zoom]
+
+        if chart:
+            self.chart_date = chart.start.date()
+        else:
+            self.chart_date = datetime.date.today()
+        self.first_monday = self.chart_date \
+            - datetime.timedelta(days=self.chart_date.weekday())
+
+        no_rows = len(chart.blocks) if chart else 0
+        no_days = (chart.no_days if chart else 0) + PADDING_DAYS
+
+        self.grid_height = self.entry_name_column_height * no_rows
+        self.full_height = self.daily_column_height + self.grid_height
+        self.grid_width = self.day_x(no_days - 1, end=True)
+        self.full_width = self.entry_name_column_width + self.grid_width
+
+    @property
+    def shows_non_working_days(self):
+        return self.zoom in ('hour', 'day')
+
+    def column_of(self, day):
+        """The column holding a day, counted from the start of the chart."""
+
+        if self.zoom in ('hour', 'day'):
+            return day
+
+        date = self.chart_date + datetime.timedelta(days=day)
+        if self.zoom == 'week':
+            return (date - self.first_monday).days // 7
+        else:
+            return (date.year - self.chart_date.year) * 12 \
+                + date.month - self.chart_date.month
+
+    def column_start(self, column):
+        """The first day of a column, which may be before the chart starts."""
+
+        if self.zoom in ('hour', 'day'):
+            return column
+
+        if self.zoom == 'week':
+            date = self.first_monday + datetime.timedelta(days=7 * column)
+        else:
+            years, month = divmod(self.chart_date.month - 1 + column, 12)
+            date = datetime.date(self.chart_date.year + years, month + 1, 1)
+
+        return (date - self.chart_date).days
+
+    def day_x(self, day, end=False):
+        """Where the column holding a day starts, or ends, in the grid."""
+
+        column = self.column_of(day)
+        if end:
+            column += 1
+        return column * self.column_width
+
+    def cell_x(self, cells, end=False):
+        """
+        Where a block starting, or ending, after a number of working hours
+        from the start of the chart is drawn in the grid.
+        """
+
+        if self.zoom == 'hour':
+            return cells * self.hourly_column_width
+
+        day, hours = divmod(cells, self.business_day_length)
+        if end and (hours or self.column_start(self.column_of(day)) != day):
+            return self.day_x(day, end=True)
+        else:
+            return self.day_x(day)
+
+    def row_at(self, y):
+        """The row at a vertical position, which may be out of range."""
+        return int((y - self.daily_column_height) // self.block_height)
+
+    def column_at(self, x):
+        """
+        The first day of the column at a horizontal position, which may be
+        out of range.
+        """
+
+        column = int((x - self.entry_name_column_width) // self.column_width)
+        return self.column_start(column)
+
+    def columns(self, viewport):
+        """
+        Pairs of the position of each column inside a viewport, and the
+        positions of the lines dividing it into hours.
+        """
+
+        first_column = self.column_of(viewport.first_day)
+        last_column = self.column_of(viewport.last_day)
+
+        for column in range(first_column, last_column + 1):
+            x = column * self.column_width
+            if self.zoom == 'hour':
+                hours = [x + i * self.hourly_column_width
+                         for i in range(1, self.business_day_length)]
+            else:
+                hours = []
+            yield x, hours
+
+    def headings(self, viewport):
+        """Pairs of position and label of the headings inside a viewport."""
+
+        last_day = min(viewport.last_day, self.chart.no_days - 1)
+
+        first_column = self.column_of(viewport.first_day)
+        last_column = self.column_of(last_day)
+
+        interval = self.heading_intervals[self.zoom]
+        format = self.heading_formats[self.zoom]
+
+        for column in range(first_column, last_column + 1):
+            if column % interval == 0:
+                day = self.chart.start \
+                    + datetime.timedelta(days=self.column_start(column))
+                yield column * self.column_width, day.strftime(format)
+
+    def view_box(self, viewport):
+        """
+        The area of the whole chart which a viewport shows, as a tuple of x,
+        y, width and height. The first row and day of the chart bring in the
+        day headings and entry names respectively.
+        """
+
+        if viewport is None:
+            return 0, 0, self.full_width, self.full_height
+
+        if viewport.bounds is not None:
+            return viewport.bounds
+
+        if viewport.first_day == 0:
+            x = 0
+        else:
+            x = self.entry_name_column_width \
+                + self.day_x(viewport.first_day)
+
+        if viewport.first_row == 0:
+            y = 0
+        else:
+            y = self.daily_column_height \
+                + self.block_height * viewport.first_row
+
+        width = self.entry_name_column_width \
+            + self.day_x(viewport.last_day, end=True) - x
+        height = self.daily_column_height \
+            + self.block_height * (viewport.last_row + 1) - y
+
+        return x, y, width, height
+
+    def size(self, viewport):
+        """The width and height of the rendered image."""
+
+        if viewport is not None and viewport.size is not None:
+            return viewport.size
+
+        _, _, width, height = self.view_box(viewport)
+        return width, height
+
+
+class Viewport:
+    """
+    A window onto part of a chart, made up of a range of rows and a range of
+    days (both inclusive, and counted from the start of the chart).
+
+    Only the parts of the chart inside the window are rendered, but they keep
+    the coordinates they have in the whole chart, so that neighbouring windows
+    line up with each other. The area shown can be overridden with bounds, in
+    those coordinates, and scaled to fit a certain size.
+    """
+
+    def __init__(self, chart, first_row=None, last_row=None, start=None,
+                 end=None, bounds=None, size=None):
+        self.chart = chart
+        self.bounds = bounds
+        self.size = size
+
+        no_rows = len(chart.blocks)
+        no_columns = chart.no_days + PADDING_DAYS
+
+        if first_row is None:
+            first_row = 0
+        if last_row is None:
+            last_row = no_rows - 1
+
+        self.first_row = min(max(first_row, 0), no_rows - 1)
+        self.last_row = min(max(last_row, self.first_row), no_rows - 1)
+
+        chart_date = chart.start.date()
+
+        if start is None:
+            first_day = 0
+        else:
+            first_day = (start - chart_date).days
+        if end is None:
+            last_day = no_columns - 1
+        else:
+            last_day = (end - chart_date).days
+
+        self.first_day = min(max(first_day, 0), no_columns - 1)
+        self.last_day = min(max(last_day, self.first_day), no_columns - 1)
+
+    @cached_property
+    def rows(self):
+        """The blocks on the rows inside the window."""
+        blocks = list(self.chart.blocks.values())
+        return blocks[self.first_row:self.last_row + 1]
+
+    @property
+    def _window(self):
+        # widen by a day either side, so that overlays and milestone markers
+        # poking out of a block are not cut off at the edges
+        midnight = datetime.datetime.combine(self.chart.start.date(),
+                                             datetime.time.min)
+        start = midnight + datetime.timedelta(days=self.first_day - 1)
+        end = midnight + datetime.timedelta(days=self.last_day + 2)
+        return start, end
+
+    def _in_rows(self, block):
+        return self.first_row <= block.index <= self.last_row
+
+    @cached_property
+    def blocks(self):
+        """The blocks which are drawn inside the window."""
+        return [block for block in self.chart.blocks_between(*self._window)
+                if self._in_rows(block)]
+
+    @property
+    def accounts(self):
+        """The accounts with avatars inside the window, each only once."""
+
+        accounts = OrderedDict()
+        for block in self.blocks:
+            for entry_member in block.entry.members:
+                member = entry_member.member
+                if member.account_id not in accounts:
+                    accounts[member.account_id] = member.account
+        return list(accounts.values())
+
+    @property
+    def resources(self):
+        """The resources with swatches inside the window, each only once."""
+
+        resources = OrderedDict()
+        for block in self.blocks:
+            for entry_resource in block.entry.resources:
+                if entry_resource.resource_id not in resources:
+                    resources[entry_resource.resource_id] = \
+                        entry_resource.resource
+        return list(resources.values())
+
+    @property
+    def milestones(self):
+        """The milestones, whose lines run through every row."""
+        return [block for block in self.chart.blocks_between(*self._window)
+                if block.entry.type.name == 'milestone']
+
+    @property
+    def dependencies(self):
+        """
+        Pairs of blocks whose dependency arrows pass through the window.
+        """
+
+        return [(dependency.block, dependency.dependee_block)
+                for dependency in self.chart.dependencies_between(
+                    self.first_row, self.last_row)]
+
+    @property
+    def days(self):
+        """Pairs of column index and date for the days inside the window."""
+        for i in range(self.first_day, min(self.last_day + 1,
+                                           self.chart.no_days)):
+            yield i, self.chart.start + datetime.timedelta(days=i)
+
+    @property
+    def non_working_runs(self):
+        """
+        Pairs of the column index of the first day and the number of days for
+        each run of non-working days inside the window.
+        """
+
+        first_day = self.first_day
+        last_day = min(self.last_day, self.chart.no_days - 1)
+        start = self.chart.start.date() + datetime.timedelta(days=first_day)
+
+        calendar = self.chart.project.calendar
+        runs = calendar.non_working_runs(start, last_day - first_day + 1)
+        return [(first_day + offset, length) for offset, length in runs]
+
+    @property
+    def columns(self):
+        return range(self.first_day, self.last_day + 1)
+
+
+def _template_context(chart, project, dynamic, today, viewport, zoom):
+    if today is None:
+        today = datetime.datetime.utcnow()
+
+    if viewport is None and chart is not None:
+        viewport = Viewport(chart)
+
+    layout = Layout(chart, project, zoom)
+
+    return {
+        'chart': chart,
+        'project': project,
+        'dynamic': dynamic,
+        'today': today,
+        'layout': layout,
+        'viewport': viewport,
+        'view_box': layout.view_box(viewport),
+        'size': layout.size(viewport),
+    }
+
+
+def render_svg(chart, project, dynamic=False, today=None, viewport=None,
+               zoom='hour'):
+    """Render the chart, or a viewport onto it, into a single string."""
+
+    context = _template_context(chart, project, dynamic, today, viewport,
+                                zoom)
+    return flask.render_template(TEMPLATE_NAME, **context)
+
+
+def generate_svg(chart, project, dynamic=False, today=None, viewport=None,
+                 zoom='hour', chunk_size=CHUNK_SIZE):
+    """
+    Render the chart piece by piece, yielding chunks of roughly chunk_size
+    characters as soon as they are ready.
+
+    The markup is identical to that of ``render_svg``, but the full document
+    is never held in memory.
+    """
+
+    app = flask.current_app
+
+    context = _template_context(chart, project, dynamic, today, viewport,
+                                zoom)
+    app.update_template_context(context)
+
+    template = app.jinja_env.get_template(TEMPLATE_NAME)
+
+    buffer = []
+    size = 0
+
+    for fragment in template.generate(context):
+        buffer.append(fragment)
+        size += len(fragment)
+
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+
+    if buffer:
+        yield ''.join(buffer)
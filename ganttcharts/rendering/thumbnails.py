@@ -0,0 +1,95 @@
+"""Small previews of Gantt charts, drawn straight from the blocks."""
+
+import io
+
+import numpy as np
+import PIL.Image
+import PIL.ImageDraw
+
+from .cache import RenderCache
+
+
+__all__ = ['THUMBNAIL_SIZE', 'thumbnail_key', 'latest_thumbnail_key',
+           'render_thumbnail']
+
+
+THUMBNAIL_SIZE = (320, 120)
+
+# rows are no taller than this, so that short projects do not look bloated
+MAX_ROW_HEIGHT = 8
+
+BACKGROUND = (255, 255, 255)
+MILESTONE_WIDTH = 2
+MIN_OUTLINED_HEIGHT = 3
+
+
+def thumbnail_key(project):
+    """
+    The render cache key of the thumbnail of a project as it is now. It goes
+    by the project's revision, which is on its row, so that a thumbnail can
+    be found without loading everything it is drawn from.
+    """
+    return RenderCache.key(project.id, project.revision, 'thumbnail',
+                           THUMBNAIL_SIZE)
+
+
+def latest_thumbnail_key(project):
+    """
+    The render cache key of the most recently rendered thumbnail of a
+    project, which may be out of date.
+    """
+    return RenderCache.key(project.id, 'latest-thumbnail', THUMBNAIL_SIZE)
+
+
+def _rgb(colour):
+    return tuple(int(x) for x in colour[4:-1].split(','))
+
+
+def render_thumbnail(chart, project, size=THUMBNAIL_SIZE):
+    """
+    Draw each block as a plain bar, scaled so that the whole chart fits, and
+    return the image as a PNG. There is no text, grid or overlay, so nothing
+    here costs more than a rectangle per block.
+    """
+
+    width, height = size
+
+    image = PIL.Image.new('RGB', size, BACKGROUND)
+
+    if chart is not None and chart.blocks:
+        blocks = list(chart.blocks.values())
+
+        rows = np.array([block.index for block in blocks])
+        starts = np.array([block.left_cells for block in blocks])
+        lengths = np.array([block.cells for block in blocks])
+
+        total_cells = max((starts + lengths).max(), 1)
+        row_height = min(height / len(chart.blocks), MAX_ROW_HEIGHT)
+
+        x0 = np.floor(starts * (width - 1) / total_cells).astype(int)
+        x1 = np.maximum(np.ceil((starts + lengths) * (width - 1)
+                                / total_cells).astype(int), x0 + 1)
+        y0 = np.floor(rows * row_height).astype(int)
+        y1 = np.maximum(np.floor((rows + 1) * row_height).astype(int) - 1, y0)
+
+        draw = PIL.ImageDraw.Draw(image)
+
+        for block, left, right, top, bottom in zip(blocks, x0, x1, y0, y1):
+            stroke = _rgb(block.stroke_colour)
+
+            # an outline would swamp a bar only a pixel or two high, and the
+            # pale fill alone would barely show
+            if block.entry.type.name == 'milestone':
+                left = right - MILESTONE_WIDTH
+                colour, outline = stroke, None
+            elif bottom - top >= MIN_OUTLINED_HEIGHT:
+                colour, outline = _rgb(block.fill_colour), stroke
+            else:
+                colour, outline = stroke, None
+
+            draw.rectangle([int(left), int(top), int(right), int(bottom)],
+                           fill=colour, outline=outline)
+
+    output = io.BytesIO()
+    image.save(output, 'PNG', optimize=True)
+    return output.getvalue()
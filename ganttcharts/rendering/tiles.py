@@ -0,0 +1,82 @@
+"""Rendering of Gantt charts as a pyramid of PNG tiles."""
+
+import datetime
+import math
+
+from .png import svg_to_png
+from .svg import Layout, Viewport, render_svg
+
+
+__all__ = ['TILE_SIZE', 'TilePyramid']
+
+
+TILE_SIZE = 256
+
+
+class TilePyramid:
+    """
+    The SVG rendering of a chart cut into square tiles at several zoom levels.
+
+    At the deepest zoom level one pixel of a tile is one unit of the SVG, and
+    each level above halves the scale, up to level zero where the whole chart
+    fits into a single tile. Tiles are numbered from the top left corner.
+    """
+
+    def __init__(self, chart, project, tile_size=TILE_SIZE):
+        self.chart = chart
+        self.project = project
+        self.tile_size = tile_size
+
+        self.layout = Layout(chart, project)
+
+        longest_side = max(self.layout.full_width, self.layout.full_height)
+        self.max_zoom = max(math.ceil(math.log2(longest_side / tile_size)), 0)
+
+    def scale(self, zoom):
+        return 2 ** (zoom - self.max_zoom)
+
+    def tile_counts(self, zoom):
+        """How many tiles across and down there are at a zoom level."""
+
+        scale = self.scale(zoom)
+        columns = math.ceil(self.layout.full_width * scale / self.tile_size)
+        rows = math.ceil(self.layout.full_height * scale / self.tile_size)
+        return columns, rows
+
+    def has_tile(self, zoom, x, y):
+        if not 0 <= zoom <= self.max_zoom:
+            return False
+
+        columns, rows = self.tile_counts(zoom)
+        return 0 <= x < columns and 0 <= y < rows
+
+    def viewport(self, zoom, x, y):
+        """The viewport showing just the parts of the chart under a tile."""
+
+        size = self.tile_size / self.scale(zoom)
+        left = x * size
+        top = y * size
+
+        chart_date = self.chart.start.date()
+        start = chart_date + datetime.timedelta(
+            days=self.layout.column_at(left))
+        end = chart_date + datetime.timedelta(
+            days=self.layout.column_at(left + size))
+
+        return Viewport(self.chart, self.layout.row_at(top),
+                        self.layout.row_at(top + size), start, end,
+                        bounds=(left, top, size, size),
+                        size=(self.tile_size, self.tile_size))
+
+    def render_tile(self, zoom, x, y):
+        svg = render_svg(self.chart, self.project,
+                         viewport=self.viewport(zoom, x, y))
+        return svg_to_png(svg)
+
+    def as_json(self):
+        return {
+            'tile_size': self.tile_size,
+            'max_zoom': self.max_zoom,
+            'width': self.layout.full_width,
+            'height': self.layout.full_height,
+        }
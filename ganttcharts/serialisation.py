@@ -0,0 +1,74 @@
+"""
+Encoding documents as compact JSON, with the fastest encoder installed.
+
+orjson is used if it is installed, then ujson, and otherwise the standard
+library's encoder.
+"""
+
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+
+__all__ = ['ENCODERS', 'available_encoders', 'dumps']
+
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serialisable.'.format(value))
+
+
+def _dumps_orjson(document):
+    # dates go through the same isoformat as everywhere else, rather than
+    # orjson's own formatting
+    return orjson.dumps(document, default=_default,
+                        option=orjson.OPT_NON_STR_KEYS |
+                        orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def _dumps_ujson(document):
+    return ujson.dumps(document, ensure_ascii=False,
+                       escape_forward_slashes=False,
+                       default=_default).encode('utf-8')
+
+
+def _dumps_json(document):
+    return json.dumps(document, ensure_ascii=False, separators=(',', ':'),
+                      default=_default).encode('utf-8')
+
+
+ENCODERS = {
+    'orjson': _dumps_orjson,
+    'ujson': _dumps_ujson,
+    'json': _dumps_json,
+}
+
+
+def available_encoders():
+    """The names of the encoders which can be used, fastest first."""
+
+    names = []
+    if orjson is not None:
+        names.append('orjson')
+    if ujson is not None:
+        names.append('ujson')
+    names.append('json')
+    return names
+
+
+def dumps(document):
+    """Encode a document as compact UTF-8 JSON."""
+    return _dumps(document)
+
+
+_dumps = ENCODERS[available_encoders()[0]]
@@ -1,4 +1,5 @@
 from ganttcharts.web import app
 
 
-app.run(port=5000, debug=True)
+# threaded, so that open event streams do not hold up everything else
+app.run(port=5000, debug=True, threaded=True)
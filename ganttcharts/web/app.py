@@ -11,6 +11,7 @@ from . import routes
 
 app = flask.Flask('ganttcharts.web')
 app.secret_key = os.environ['SECRET_KEY']
+app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
 app.wsgi_app = ProxyFix(app.wsgi_app)
 
 sentry = Sentry(app)
@@ -0,0 +1,304 @@
+"""
+Applying many changes to the entries of a project at once.
+"""
+
+from collections import OrderedDict
+
+import dateutil.parser
+import sqlalchemy
+from sqlalchemy import and_, or_
+
+from ganttcharts.chart import Chart, InvalidGanttChart
+from ganttcharts.models import ProjectEntry, ProjectEntryDependency, \
+    ProjectEntryMember, ProjectEntryResource, ProjectEntryType, \
+    ProjectMember, ProjectResource, delete_entries, load_project_graph, \
+    record_entry_changes
+from ganttcharts.web import errors, validation
+
+
+ENTRY_FIELDS = {
+    'name': {'type': 'string'},
+    'description': {'type': 'string'},
+    'type': {'type': 'string',
+             'allowed': [type.name for type in ProjectEntryType]},
+    'normal_time_estimate': {'type': 'integer', 'coerce': int},
+    'pessimistic_time_estimate': {'type': 'integer', 'coerce': int},
+    'min_start_date': {'type': 'datetime', 'coerce': dateutil.parser.parse,
+                       'nullable': True},
+}
+
+REQUIRED_ENTRY_FIELDS = ('name', 'type', 'normal_time_estimate',
+                         'pessimistic_time_estimate')
+
+# an entry is either an existing one, by ID, or one created earlier in the
+# batch, by the temporary ID the client gave it
+ENTRY_REFERENCE = {'type': ['integer', 'string'], 'required': True}
+ID = {'type': 'integer', 'required': True}
+
+
+def _schema(op, **fields):
+    fields['op'] = {'type': 'string', 'required': True, 'allowed': [op]}
+    return fields
+
+
+CREATE_FIELDS = {name: dict(field, required=name in REQUIRED_ENTRY_FIELDS)
+                 for name, field in ENTRY_FIELDS.items()}
+
+SCHEMAS = {
+    'create': _schema('create', id={'type': 'string', 'required': True},
+                      **CREATE_FIELDS),
+    'update': _schema('update', id=ENTRY_REFERENCE, **ENTRY_FIELDS),
+    'delete': _schema('delete', id=ENTRY_REFERENCE),
+    'add_dependency': _schema('add_dependency', parent=ENTRY_REFERENCE,
+                              child=ENTRY_REFERENCE),
+    'remove_dependency': _schema('remove_dependency', parent=ID, child=ID),
+    'add_resource': _schema('add_resource', entry=ENTRY_REFERENCE,
+                            resource=ID,
+                            amount={'type': 'integer', 'required': True,
+                                    'coerce': int}),
+    'remove_resource': _schema('remove_resource', entry=ID, resource=ID),
+    'add_member': _schema('add_member', entry=ENTRY_REFERENCE, member=ID),
+    'remove_member': _schema('remove_member', entry=ID, member=ID),
+}
+
+for op, schema in SCHEMAS.items():
+    validation.register('entry_batch.' + op, schema)
+
+ENTRY_REFERENCE_FIELDS = {
+    'update': ('id',),
+    'delete': ('id',),
+    'add_dependency': ('parent', 'child'),
+    'remove_dependency': ('parent', 'child'),
+    'add_resource': ('entry',),
+    'remove_resource': ('entry',),
+    'add_member': ('entry',),
+    'remove_member': ('entry',),
+}
+
+
+class EntryBatch:
+    """
+    A list of operations on the entries of a project, which are applied in
+    a single transaction.
+
+    Whatever order the operations come in, entries are created first, then
+    updated, then links between entries are removed and added, and finally
+    entries are deleted along with everything linking to them. Each phase is
+    a handful of statements however many operations it has, and the graph is
+    only checked once, at the end.
+    """
+
+    def __init__(self, session, project, operations):
+        self.session = session
+        self.project = project
+        self.operations = operations
+
+        self.documents = OrderedDict((op, []) for op in SCHEMAS)
+        self.created = OrderedDict()
+
+        # the session does not see bulk statements, so the entries they
+        # change are recorded against the project's revision by hand
+        self.changed_ids = set()
+        self.deleted_ids = set()
+
+    def validate(self):
+        """Check every operation, raising InvalidFormData if any are bad."""
+
+        if not isinstance(self.operations, list):
+            raise errors.InvalidFormData(
+                errors={'operations': ['Must be a list.']})
+
+        details = {}
+
+        for i, operation in enumerate(self.operations):
+            try:
+                op = operation['op']
+            except (KeyError, TypeError):
+                op = None
+
+            if not isinstance(op, str) or op not in SCHEMAS:
+                details[i] = {'op': ['Unknown operation.']}
+                continue
+
+            validator = validation.get_validator('entry_batch.' + op)
+            if validator.validate(operation):
+                document = validator.document
+                self.documents[document['op']].append((i, document))
+            else:
+                details[i] = validator.errors
+
+        if not details:
+            details = self._check_references()
+
+        if details:
+            raise errors.InvalidFormData(errors={'operations': details})
+
+    def _ids(self, model, column):
+        query = self.session.query(model.id) \
+            .filter(column == self.project.id)
+        return set(id for id, in query)
+
+    def _check_references(self):
+        details = {}
+
+        temporary_ids = set()
+        for i, document in self.documents['create']:
+            if document['id'] in temporary_ids:
+                details[i] = {'id': ['Already used.']}
+            temporary_ids.add(document['id'])
+
+        entry_ids = self._ids(ProjectEntry, ProjectEntry.project_id)
+
+        for op, fields in ENTRY_REFERENCE_FIELDS.items():
+            for i, document in self.documents[op]:
+                for field in fields:
+                    reference = document[field]
+                    if reference not in entry_ids \
+                            and reference not in temporary_ids:
+                        details.setdefault(i, {})[field] = ['Unknown entry.']
+
+        for op, field, model in (
+                ('add_resource', 'resource', ProjectResource),
+                ('remove_resource', 'resource', ProjectResource),
+                ('add_member', 'member', ProjectMember),
+                ('remove_member', 'member', ProjectMember)):
+            if not self.documents[op]:
+                continue
+
+            ids = self._ids(model, model.project_id)
+            for i, document in self.documents[op]:
+                if document[field] not in ids:
+                    details.setdefault(i, {})[field] = \
+                        ['Unknown {}.'.format(field)]
+
+        return details
+
+    def _resolve(self, reference):
+        if isinstance(reference, str):
+            return self.created[reference].id
+        else:
+            return reference
+
+    def _create(self):
+        for _, document in self.documents['create']:
+            entry = ProjectEntry(document['name'],
+                                 document.get('description', ''),
+                                 ProjectEntryType[document['type']],
+                                 document['normal_time_estimate'],
+                                 document['pessimistic_time_estimate'],
+                                 self.project)
+            entry.min_start_date = document.get('min_start_date')
+            self.created[document['id']] = entry
+
+        self.session.add_all(self.created.values())
+        self.session.flush()
+
+    def _update(self):
+        mappings = []
+        for _, document in self.documents['update']:
+            mapping = {'id': self._resolve(document['id'])}
+            for name in ENTRY_FIELDS:
+                if name in document:
+                    mapping[name] = document[name]
+            if 'type' in mapping:
+                mapping['_type'] = mapping.pop('type')
+            mappings.append(mapping)
+            self.changed_ids.add(mapping['id'])
+
+        if mappings:
+            self.session.bulk_update_mappings(ProjectEntry, mappings)
+
+    def _remove_links(self):
+        for op, model, columns in (
+                ('remove_dependency', ProjectEntryDependency,
+                 (('parent', 'parent_id'), ('child', 'child_id'))),
+                ('remove_resource', ProjectEntryResource,
+                 (('entry', 'entry_id'), ('resource', 'resource_id'))),
+                ('remove_member', ProjectEntryMember,
+                 (('entry', 'entry_id'), ('member', 'member_id')))):
+            conditions = [
+                and_(*[getattr(model, column) == document[field]
+                       for field, column in columns])
+                for _, document in self.documents[op]
+            ]
+
+            if conditions:
+                self.session.query(model).filter(or_(*conditions)) \
+                    .delete(synchronize_session=False)
+
+            self.changed_ids.update(document[columns[0][0]]
+                                    for _, document in self.documents[op])
+
+    def _add_links(self):
+        dependencies = [{'parent_id': self._resolve(document['parent']),
+                         'child_id': self._resolve(document['child'])}
+                        for _, document in self.documents['add_dependency']]
+        resources = [{'entry_id': self._resolve(document['entry']),
+                      'resource_id': document['resource'],
+                      'amount': document['amount']}
+                     for _, document in self.documents['add_resource']]
+        members = [{'entry_id': self._resolve(document['entry']),
+                    'member_id': document['member']}
+                   for _, document in self.documents['add_member']]
+
+        for model, mappings in ((ProjectEntryDependency, dependencies),
+                                (ProjectEntryResource, resources),
+                                (ProjectEntryMember, members)):
+            if mappings:
+                self.session.bulk_insert_mappings(model, mappings)
+
+        self.changed_ids.update(mapping['parent_id']
+                                for mapping in dependencies)
+        self.changed_ids.update(mapping['entry_id']
+                                for mapping in resources + members)
+
+    def _delete(self):
+        ids = [self._resolve(document['id'])
+               for _, document in self.documents['delete']]
+        if not ids:
+            return
+
+        self.deleted_ids.update(ids)
+        self.changed_ids.update(
+            delete_entries(self.session, self.project.id, ids))
+
+    def apply(self):
+        """
+        Apply the operations and commit, returning the IDs the created entries
+        were given by their temporary IDs. Nothing is kept if the graph would
+        end up invalid, in which case InvalidGraph is raised.
+        """
+
+        try:
+            self._create()
+            self._update()
+            self._remove_links()
+            self._add_links()
+            self._delete()
+            self.session.flush()
+
+            record_entry_changes(self.session, self.project.id,
+                                 self.changed_ids - self.deleted_ids,
+                                 self.deleted_ids)
+        except sqlalchemy.exc.IntegrityError:
+            self.session.rollback()
+            raise errors.InvalidGraph()
+
+        # the bulk statements bypassed the objects already in the session
+        ids = OrderedDict((temporary_id, entry.id)
+                          for temporary_id, entry in self.created.items())
+        self.session.expire_all()
+
+        project = load_project_graph(self.session, self.project.id)
+
+        # a project left without entries has no chart, but is not invalid
+        if project.entries:
+            try:
+                Chart(project)
+            except InvalidGanttChart:
+                self.session.rollback()
+                raise errors.InvalidGraph()
+
+        self.session.commit()
+
+        return ids
@@ -1,5 +1,6 @@
 from werkzeug.exceptions import BadRequest, Conflict, Forbidden, \
-    NotFound as BaseNotFound, MethodNotAllowed, Unauthorized
+    NotFound as BaseNotFound, MethodNotAllowed, ServiceUnavailable, \
+    Unauthorized
 
 
 # 400
@@ -55,3 +56,19 @@ class AlreadyExists(Conflict):
 
 class InvalidGraph(Conflict):
     description = 'This would make an invalid graph.'
+
+
+# 503
+class TooBusy(ServiceUnavailable):
+    description = 'Too busy to do this right now, try again later.'
+
+    def __init__(self, retry_after):
+        super().__init__()
+
+        self.retry_after = retry_after
+        self.details = {'retry_after': retry_after}
+
+    def get_headers(self, environ=None):
+        headers = super().get_headers(environ)
+        headers.append(('Retry-After', str(self.retry_after)))
+        return headers
@@ -0,0 +1,416 @@
+"""
+Server-sent events telling the people looking at a project about changes
+made to it by everyone else.
+
+Each process has a broker for the streams it serves. On Postgres, every
+broker listens for the revisions announced by whichever process committed
+them, so a stream hears about changes made through any web process or
+worker. Otherwise, as when developing against another database, the
+changes are only heard of within the process that made them.
+"""
+
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import select
+import threading
+import time
+
+import sqlalchemy
+
+from ganttcharts import database, serialisation
+from ganttcharts.chart import Chart, InvalidGanttChart
+from ganttcharts.models import REVISIONS_CHANNEL, Session as SqlSession, \
+    load_project_graph
+
+
+MAX_PENDING_EVENTS = 64
+KEEP_ALIVE_INTERVAL = 15
+RECONNECT_INTERVAL = 5
+
+# a stream holds on to a web worker's thread, so each process only serves so
+# many, and each for so long before the client is left to reconnect
+MAX_SUBSCRIPTIONS_KEY = 'MAX_EVENT_STREAMS'
+DEFAULT_MAX_SUBSCRIPTIONS = 4
+MAX_STREAM_DURATION = 5 * 60
+
+logger = logging.getLogger(__name__)
+
+
+_broker = None
+
+
+class TooManySubscriptions(Exception):
+    """Raised when a process is already serving as many streams as it can."""
+
+
+class Event:
+    """
+    An event, encoded once however many subscribers it is sent to.
+    """
+
+    def __init__(self, name, revision, data):
+        self.name = name
+        self.revision = revision
+        self.encoded = 'id: {}\nevent: {}\ndata: '.format(revision, name) \
+            .encode('utf-8') + serialisation.dumps(data) + b'\n\n'
+
+
+class Subscription:
+    """
+    The events waiting to be sent down one stream.
+
+    A subscriber which falls too far behind has its backlog replaced by a
+    single reset event, after which it should fetch the project afresh.
+    """
+
+    def __init__(self, project_id, schedule=False):
+        self.project_id = project_id
+        self.schedule = schedule
+
+        self._events = deque()
+        self._condition = threading.Condition()
+
+    def put(self, event):
+        with self._condition:
+            if len(self._events) >= MAX_PENDING_EVENTS:
+                self._events.clear()
+                event = Event('reset', event.revision,
+                              {'revision': event.revision})
+
+            self._events.append(event)
+            self._condition.notify()
+
+    def reset(self):
+        """
+        Replace the backlog with a reset event, for when changes may have
+        been missed. Its revision is unknown, so the client's last one is
+        kept.
+        """
+
+        with self._condition:
+            self._events.clear()
+            self._events.append(Event('reset', '', {'revision': None}))
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """The next event, or None if there was none within the timeout."""
+
+        with self._condition:
+            if not self._events:
+                self._condition.wait(timeout)
+
+            if self._events:
+                return self._events.popleft()
+            else:
+                return None
+
+
+def schedule_of(chart):
+    """The start and end of each entry's block, by the entry's ID."""
+
+    return {entry.id: [block.start.isoformat(), block.end.isoformat()]
+            for entry, block in chart.blocks.items()}
+
+
+def diff_schedules(old, new):
+    """
+    The blocks which were added or moved between two schedules, and the
+    entries which no longer have one. Without an old schedule, every block
+    is included.
+    """
+
+    if old is None:
+        return new, []
+
+    blocks = {entry_id: block for entry_id, block in new.items()
+              if old.get(entry_id) != block}
+    removed = [entry_id for entry_id in old if entry_id not in new]
+
+    return blocks, removed
+
+
+class Broker:
+    """
+    Hands out the events of each project to the subscribers in this process,
+    as revisions are published to it.
+
+    Change events only carry the project's new revision, which a client can
+    catch up from with the entry changes endpoint. Subscribers which asked
+    for the schedule are also sent the blocks which moved, which are worked
+    out once per change by a background thread however many of them there
+    are. Changes which come in while the chart is being worked out are
+    covered by a single further run.
+    """
+
+    def __init__(self, max_subscriptions=None):
+        if max_subscriptions is None:
+            max_subscriptions = int(os.environ.get(
+                MAX_SUBSCRIPTIONS_KEY, DEFAULT_MAX_SUBSCRIPTIONS))
+
+        self.max_subscriptions = max_subscriptions
+
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+        # the schedule last sent for each project, which the next is
+        # compared with
+        self._schedules = {}
+        self._pending = set()
+        self._running = set()
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+        self.listening = False
+
+    def listen(self, engine):
+        """
+        Start hearing of the revisions committed by every process, from a
+        thread of its own.
+        """
+
+        self.listening = True
+
+        thread = threading.Thread(target=self._listen, args=(engine,),
+                                  name='events-listener', daemon=True)
+        thread.start()
+
+    def _listen(self, engine):
+        while True:
+            try:
+                self._receive_notifications(engine)
+            except Exception:
+                logger.exception('Lost the connection listening for project '
+                                 'revisions, reconnecting.')
+
+                # anything committed in the meantime was missed
+                self._reset_all()
+
+                time.sleep(RECONNECT_INTERVAL)
+
+    def _receive_notifications(self, engine):
+        # a connection of its own, kept out of the pool for good
+        connection = engine.raw_connection()
+        connection.detach()
+
+        try:
+            connection.connection.autocommit = True
+
+            cursor = connection.cursor()
+            cursor.execute('LISTEN {}'.format(REVISIONS_CHANNEL))
+
+            notifies = connection.connection.notifies
+
+            while True:
+                select.select([connection.connection], [], [],
+                              KEEP_ALIVE_INTERVAL)
+                connection.connection.poll()
+
+                while notifies:
+                    project_id, revision = notifies.pop(0).payload.split(':')
+                    self.publish(int(project_id), int(revision))
+        finally:
+            connection.close()
+
+    def _reset_all(self):
+        """Tell every subscriber to fetch its project afresh."""
+
+        with self._lock:
+            subscriptions = [subscription for subscriptions
+                             in self._subscriptions.values()
+                             for subscription in subscriptions]
+
+            # so the schedules they are sent next are worked out afresh
+            self._schedules.clear()
+
+        for subscription in subscriptions:
+            subscription.reset()
+
+    def subscribe(self, project_id, schedule=False):
+        """Subscribe to a project's events, or raise TooManySubscriptions."""
+
+        subscription = Subscription(project_id, schedule)
+
+        with self._lock:
+            count = sum(len(subscriptions)
+                        for subscriptions in self._subscriptions.values())
+            if count >= self.max_subscriptions:
+                raise TooManySubscriptions()
+
+            self._subscriptions[project_id].add(subscription)
+
+        if schedule:
+            self.send_schedule(subscription)
+
+        return subscription
+
+    def send_schedule(self, subscription):
+        """
+        Send a subscriber the whole of the last schedule, which the ones after
+        it are relative to, working it out first if need be.
+        """
+
+        with self._lock:
+            current = self._schedules.get(subscription.project_id)
+
+            # the first schedule goes out in full to everyone anyway
+            in_progress = subscription.project_id in self._pending or \
+                subscription.project_id in self._running
+
+        if current is None:
+            if not in_progress:
+                self._schedule_soon(subscription.project_id)
+        else:
+            revision, blocks = current
+            subscription.put(self._schedule_event(revision, blocks, [],
+                                                  full=True))
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions[subscription.project_id]
+            subscriptions.discard(subscription)
+
+            if not subscriptions:
+                del self._subscriptions[subscription.project_id]
+                self._schedules.pop(subscription.project_id, None)
+
+    def _subscribers(self, project_id, schedule=False):
+        with self._lock:
+            return [subscription for subscription
+                    in self._subscriptions.get(project_id, ())
+                    if subscription.schedule or not schedule]
+
+    def publish(self, project_id, revision):
+        subscriptions = self._subscribers(project_id)
+        if not subscriptions:
+            return
+
+        event = Event('change', revision, {'revision': revision})
+        for subscription in subscriptions:
+            subscription.put(event)
+
+        if any(subscription.schedule for subscription in subscriptions):
+            self._schedule_soon(project_id)
+
+    def _schedule_soon(self, project_id):
+        with self._lock:
+            if project_id in self._pending:
+                return
+            self._pending.add(project_id)
+
+        self._executor.submit(self._publish_schedule, project_id)
+
+    @staticmethod
+    def _schedule_event(revision, blocks, removed, full=False):
+        return Event('schedule', revision, {
+            'revision': revision,
+            'full': full,
+            'blocks': blocks,
+            'removed': removed,
+        })
+
+    def _publish_schedule(self, project_id):
+        with self._lock:
+            self._pending.discard(project_id)
+            self._running.add(project_id)
+
+        try:
+            revision, schedule = compute_schedule(project_id)
+        except Exception:
+            logger.exception('Failed to compute the schedule of project %s.',
+                             project_id)
+            return
+        finally:
+            with self._lock:
+                self._running.discard(project_id)
+
+        with self._lock:
+            if project_id not in self._subscriptions:
+                return
+
+            previous = self._schedules.get(project_id)
+            self._schedules[project_id] = (revision, schedule)
+
+        blocks, removed = diff_schedules(
+            previous[1] if previous is not None else None, schedule)
+        if previous is not None and not blocks and not removed:
+            return
+
+        event = self._schedule_event(revision, blocks, removed,
+                                     full=previous is None)
+        for subscription in self._subscribers(project_id, schedule=True):
+            subscription.put(event)
+
+
+def compute_schedule(project_id):
+    """Work out a project's chart with a session of its own."""
+
+    session = SqlSession()
+
+    try:
+        project = load_project_graph(session, project_id)
+
+        try:
+            schedule = schedule_of(Chart(project))
+        except InvalidGanttChart:
+            schedule = {}
+
+        return project.revision, schedule
+    finally:
+        SqlSession.remove()
+
+
+def get_broker():
+    global _broker
+
+    if _broker is None:
+        _broker = Broker()
+
+        engine = database.get_sql_engine()
+        if engine.dialect.name == 'postgresql':
+            _broker.listen(engine)
+
+    return _broker
+
+
+def stream(subscription):
+    """
+    The body of a text/event-stream response for a subscription, which ends
+    after a while for the client to reconnect, saying where it was up to.
+    """
+
+    broker = get_broker()
+    deadline = time.monotonic() + MAX_STREAM_DURATION
+
+    try:
+        while time.monotonic() < deadline:
+            event = subscription.get(KEEP_ALIVE_INTERVAL)
+            if event is None:
+                # a comment, which also finds out if the client has gone
+                yield b': keep-alive\n\n'
+            else:
+                yield event.encoded
+
+                if event.name == 'reset' and subscription.schedule:
+                    broker.send_schedule(subscription)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@sqlalchemy.event.listens_for(SqlSession, 'after_commit')
+def publish_revisions(session):
+    revisions = session.info.pop('revisions', {})
+
+    # without a broker, nobody in this process is listening, and one which
+    # listens to Postgres hears of the revisions from there
+    if _broker is None or _broker.listening:
+        return
+
+    for project_id, revision in revisions.items():
+        _broker.publish(project_id, revision)
+
+
+@sqlalchemy.event.listens_for(SqlSession, 'after_rollback')
+def forget_revisions(session):
+    session.info.pop('revisions', None)
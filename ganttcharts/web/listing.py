@@ -0,0 +1,135 @@
+"""
+Paging through and trimming down the lists the API returns.
+"""
+
+import base64
+import datetime
+import json
+
+import dateutil.parser
+import flask
+from sqlalchemy import and_, or_
+
+from ganttcharts.web import errors
+
+
+MAX_LIMIT = 500
+
+
+def get_fields_arg(allowed):
+    """
+    The fields asked for with the ``fields`` query parameter, e.g.
+    ``?fields=id,name``, or None if every field should be returned. The ID is
+    always included.
+    """
+
+    try:
+        value = flask.request.args['fields']
+    except KeyError:
+        return None
+
+    fields = [name for name in value.split(',') if name]
+
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise errors.InvalidFormData(
+            errors={'fields': ['Unknown field: {}.'.format(name)
+                               for name in unknown]})
+
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+
+    return fields
+
+
+def get_limit_arg():
+    try:
+        value = flask.request.args['limit']
+    except KeyError:
+        return None
+
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = None
+
+    if limit is None or not 1 <= limit <= MAX_LIMIT:
+        raise errors.InvalidFormData(
+            errors={'limit': ['Must be between 1 and {}.'.format(MAX_LIMIT)]})
+
+    return limit
+
+
+def select_fields(json, fields):
+    if fields is None:
+        return json
+    else:
+        return {name: json[name] for name in fields}
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime.datetime)
+              else value for value in values]
+    data = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii'))
+                            .decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError()
+
+        return [dateutil.parser.parse(value)
+                if column.type.python_type is datetime.datetime else value
+                for column, value in zip(columns, values)]
+    except (ValueError, TypeError, OverflowError):
+        raise errors.InvalidFormData(errors={'after': ['Not a valid cursor.']})
+
+
+def _after(columns, values):
+    """The condition for a row to come after the given values of columns."""
+
+    column, value = columns[0], values[0]
+
+    if len(columns) == 1:
+        return column > value
+    else:
+        return or_(column > value,
+                   and_(column == value, _after(columns[1:], values[1:])))
+
+
+def paginate(query, columns):
+    """
+    Order the query by the columns, the last of which must be unique, and
+    return the page of rows asked for with the ``after`` and ``limit`` query
+    parameters, along with the cursor of the next page, if there is one.
+
+    Pages are found by the values of the columns rather than an offset, so
+    the database can go straight to a page using its index however far into
+    the list it is, and rows added or deleted in between requests do not
+    make a client skip or repeat any others.
+    """
+
+    query = query.order_by(*columns)
+
+    try:
+        cursor = flask.request.args['after']
+    except KeyError:
+        pass
+    else:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns)))
+
+    limit = get_limit_arg()
+    if limit is None:
+        return query.all(), None
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    cursor = encode_cursor([getattr(rows[-1], column.key)
+                            for column in columns])
+    return rows, cursor
@@ -0,0 +1,212 @@
+"""
+Responses built from the render cache, compressed where the client allows.
+"""
+
+from contextlib import contextmanager
+import hashlib
+
+import flask
+
+from ganttcharts import rendering, serialisation
+from ganttcharts.web import errors
+
+
+@contextmanager
+def render_slot():
+    """
+    Hold a turn at rendering for the duration, or raise TooBusy if there was
+    none to be had in time.
+    """
+
+    try:
+        slot = rendering.get_admission().slot()
+    except rendering.Busy as e:
+        raise errors.TooBusy(e.retry_after)
+
+    with slot:
+        yield
+
+
+def _lookup(cache, key, variant, encoding):
+    """A rendering's variant from the cache, compressing it if need be."""
+
+    data = cache.get(variant)
+
+    if data is None and encoding is not None:
+        data = cache.get(key)
+        if data is not None:
+            data = rendering.compress(data, encoding)
+            cache.put(variant, data)
+
+    return data
+
+
+def _store(cache, key, variant, encoding, data):
+    """
+    Put a rendering into the cache and return what to send. A streamed
+    rendering is stored as it is sent.
+    """
+
+    if isinstance(data, bytes):
+        cache.put(key, data)
+        if encoding is not None:
+            data = rendering.compress(data, encoding)
+            cache.put(variant, data)
+        return data
+
+    chunks = cache.tee(key, data)
+    if encoding is not None:
+        chunks = cache.tee(variant,
+                           rendering.compress_stream(chunks, encoding))
+
+    return flask.stream_with_context(chunks)
+
+
+def _render(cache, key, variant, encoding, render):
+    """
+    Produce a rendering and put it in the cache, unless someone else does
+    while this waits its turn.
+
+    Returns the rendering and the locks to release once it has been sent,
+    which are only still held if it is streamed.
+    """
+
+    admission = rendering.get_admission()
+    locks = []
+
+    try:
+        locks.append(admission.flight(key))
+
+        data = _lookup(cache, key, variant, encoding)
+        if data is not None:
+            return data, []
+
+        locks.append(admission.slot())
+
+        data = render()
+        if isinstance(data, bytes):
+            return _store(cache, key, variant, encoding, data), []
+
+        streaming, locks = locks, []
+        return _store(cache, key, variant, encoding, data), streaming
+    except rendering.Busy as e:
+        raise errors.TooBusy(e.retry_after)
+    finally:
+        for lock in locks:
+            lock.release()
+
+
+def _negotiate(mimetype):
+    """
+    Whether a document is compressible, and the content coding to compress
+    it with, if any.
+    """
+
+    compressible = rendering.is_compressible(mimetype)
+
+    encoding = None
+    if compressible:
+        encoding = rendering.negotiate_encoding(
+            flask.request.accept_encodings)
+
+    return compressible, encoding
+
+
+def _not_modified(etag, mimetype, compressible):
+    response = flask.Response(status=304, mimetype=mimetype)
+    response.set_etag(etag)
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def cached_response(key, mimetype, render):
+    """
+    Respond with a rendering from the render cache, producing it with render
+    if it is not there already.
+
+    The key doubles as the ETag, so conditional requests can be answered
+    without rendering anything. Text documents are compressed with the best
+    content coding the client accepts, and each compressed variant is cached
+    alongside the rendering so it is only compressed once.
+
+    Renderings are subject to admission control: concurrent requests for the
+    same rendering share a single one, and a request which has to wait too
+    long for its turn to render is turned away with TooBusy.
+    """
+
+    compressible, encoding = _negotiate(mimetype)
+
+    cache = rendering.get_render_cache()
+    variant = cache.variant(key, encoding)
+
+    if flask.request.if_none_match.contains(variant):
+        return _not_modified(variant, mimetype, compressible)
+
+    locks = []
+
+    data = _lookup(cache, key, variant, encoding)
+    if data is None:
+        data, locks = _render(cache, key, variant, encoding, render)
+
+    response = flask.Response(data, mimetype=mimetype)
+
+    for lock in locks:
+        response.call_on_close(lock.release)
+    response.set_etag(variant)
+
+    if encoding is not None:
+        response.content_encoding = encoding
+    if compressible:
+        response.vary.add('Accept-Encoding')
+
+    last_modified = cache.last_modified(variant)
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    response.make_conditional(flask.request)
+
+    return response
+
+
+def compressed_response(data, mimetype):
+    """
+    Respond with a document which was not rendered, compressed with the best
+    content coding the client accepts.
+
+    Such documents are mostly only asked for once, so they are compressed as
+    they are sent rather than kept in the render cache, where they would
+    push out renderings. Their hash is still the ETag, so a client asking
+    again for one which has not changed gets nothing back.
+    """
+
+    compressible, encoding = _negotiate(mimetype)
+
+    etag = rendering.RenderCache.variant(hashlib.sha256(data).hexdigest(),
+                                         encoding)
+
+    if flask.request.if_none_match.contains(etag):
+        return _not_modified(etag, mimetype, compressible)
+
+    if encoding is not None:
+        data = rendering.compress(data, encoding)
+
+    response = flask.Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+
+    if encoding is not None:
+        response.content_encoding = encoding
+    if compressible:
+        response.vary.add('Accept-Encoding')
+
+    return response
+
+
+def json_response(document, status=200):
+    """
+    Respond with a document as compact JSON, which is quicker to produce and
+    smaller to send than what jsonify makes.
+    """
+
+    return flask.Response(serialisation.dumps(document), status,
+                          mimetype='application/json')
@@ -2,24 +2,38 @@
 Routes for the API.
 """
 
+from collections import OrderedDict
 import datetime
 import dateutil.parser
 
-from cerberus import Validator
 import flask
 import sqlalchemy
 
+from ganttcharts import rendering, serialisation
 from ganttcharts.chart import Chart, InvalidGanttChart
 from ganttcharts.models import AccessLevel, Project, \
     ProjectCalendarHoliday, ProjectEntry, ProjectEntryDependency, \
     ProjectEntryMember, ProjectEntryType, ProjectEntryResource, \
-    ProjectMember, ProjectResource
-from ganttcharts.web import errors, forms
+    ProjectEntryTombstone, ProjectMember, ProjectResource, delete_entries, \
+    delete_project, entry_options, load_project_graph, record_entry_changes
+from ganttcharts.web import errors, events, forms, listing, responses, \
+    validation
+from ganttcharts.web.batch import EntryBatch
 
 
 blueprint = flask.Blueprint('api', __name__, url_prefix='/api')
 
 
+COMPACT_JSON_MIMETYPE = 'application/vnd.ganttcharts.compact+json'
+SCHEDULE_MIMETYPE = 'application/vnd.ganttcharts.schedule'
+
+GANTT_CHART_FORMATS = OrderedDict([
+    ('json', 'application/json'),
+    ('compact', COMPACT_JSON_MIMETYPE),
+    ('binary', SCHEDULE_MIMETYPE),
+])
+
+
 @blueprint.before_request
 def check_csrf_token(*args, **kwargs):
     if flask.current_app.debug:
@@ -43,10 +57,7 @@ def check_logged_in(*args, **kwargs):
 
 @blueprint.route('/account', methods=['PATCH'])
 def change_account():
-    validator = Validator({
-        'display_name': {'type': 'string'},
-        'receive_summary_email': {'type': 'boolean'},
-    })
+    validator = validation.get_validator('account')
 
     if validator.validate(flask.request.json, update=True):
         doc = validator.document
@@ -68,10 +79,18 @@ def change_account():
         raise errors.InvalidFormData(validator)
 
 
-def get_project_or_404(project_id):
+def get_project_or_404(project_id, graph=False):
+    """
+    Fetch a project. With graph, everything its chart is scheduled from is
+    loaded up front, rather than a query at a time as it is used.
+    """
+
     try:
-        return flask.g.sql_session.query(Project) \
-            .filter(Project.id == project_id).one()
+        if graph:
+            return load_project_graph(flask.g.sql_session, project_id)
+        else:
+            return flask.g.sql_session.query(Project) \
+                .filter(Project.id == project_id).one()
     except sqlalchemy.orm.exc.NoResultFound:
         raise errors.NotFound()
 
@@ -93,7 +112,8 @@ def get_project_member_or_403(project):
     return member
 
 
-@blueprint.route('/projects/<int:project_id>', methods=['GET', 'PATCH'])
+@blueprint.route('/projects/<int:project_id>',
+                 methods=['GET', 'PATCH', 'DELETE'])
 def project(project_id):
     project = get_project_or_404(project_id)
     account_member = get_project_member_or_403(project)
@@ -105,10 +125,7 @@ def project(project_id):
         if not account_member.access_level.can_administrate:
             raise errors.MissingPermission('can_administrate')
 
-        validator = Validator({
-            'name': {'type': 'string'},
-            'description': {'type': 'string'},
-        })
+        validator = validation.get_validator('project')
 
         if validator.validate(flask.request.json, update=True):
             doc = validator.document
@@ -130,6 +147,14 @@ def project(project_id):
             raise errors.InvalidFormData(validator)
     elif flask.request.method == 'GET':
         return flask.jsonify(project=project.as_json())
+    elif flask.request.method == 'DELETE':
+        if not account_member.access_level.owner:
+            raise errors.MissingPermission('owner')
+
+        delete_project(flask.g.sql_session, project.id)
+        flask.g.sql_session.commit()
+
+        return '', 204
 
 
 @blueprint.route('/projects/<int:project_id>/calendar', methods=['GET', 'PATCH'])
@@ -193,10 +218,6 @@ def project_calendar_holidays(project_id):
         raise errors.InvalidFormData(form)
 
 
-def coerce_date(string):
-    return datetime.datetime.strptime(string, '%Y-%m-%d')
-
-
 @blueprint.route('/projects/<int:project_id>/calendar/holidays/<int:holiday_id>', methods=['GET', 'PATCH', 'DELETE'])
 def project_calendar_holiday(project_id, holiday_id):
     project = get_project_or_404(project_id)
@@ -214,11 +235,7 @@ def project_calendar_holiday(project_id, holiday_id):
         raise errors.MissingPermission('can_administrate')
 
     if flask.request.method == 'PATCH':
-        validator = Validator({
-            'name': {'type': 'string'},
-            'start': {'type': 'datetime', 'coerce': coerce_date},
-            'end': {'type': 'datetime', 'coerce': coerce_date},
-        })
+        validator = validation.get_validator('holiday')
 
         if validator.validate(flask.request.json, update=True):
             doc = validator.document
@@ -259,8 +276,55 @@ def project_entries(project_id):
         if not account_member.access_level.can_view:
             raise errors.MissingPermission('can_view')
 
-        entries = [entry.as_json() for entry in project.entries]
-        return flask.jsonify(entries=entries)
+        fields = listing.get_fields_arg(ProjectEntry.JSON_FIELDS)
+
+        query = flask.g.sql_session.query(ProjectEntry) \
+            .options(*entry_options(fields)) \
+            .filter(ProjectEntry.project_id == project.id)
+
+        type = flask.request.args.get('type')
+        if type is not None:
+            if type not in ProjectEntryType.__members__:
+                raise errors.InvalidFormData(
+                    errors={'type': ['Not a valid type.']})
+            query = query.filter(ProjectEntry.type == type)
+
+        member_id = get_int_arg('member')
+        if member_id is not None:
+            query = query.filter(ProjectEntry.members.any(
+                ProjectEntryMember.member_id == member_id))
+
+        resource_id = get_int_arg('resource')
+        if resource_id is not None:
+            query = query.filter(ProjectEntry.resources.any(
+                ProjectEntryResource.resource_id == resource_id))
+
+        # entries are only scheduled when the chart is made, so a window
+        # means working it out, and keeping the entries whose blocks overlap
+        start = get_date_arg('start')
+        end = get_date_arg('end')
+        if start is not None or end is not None:
+            graph = load_project_graph(flask.g.sql_session, project.id)
+
+            try:
+                with responses.render_slot():
+                    chart = Chart(graph)
+            except InvalidGanttChart:
+                raise errors.NotFound()
+
+            blocks = chart.blocks_between(start or chart.start,
+                                          end or chart.end)
+            query = query.filter(ProjectEntry.id.in_(
+                [block.entry.id for block in blocks]))
+
+        entries, cursor = listing.paginate(
+            query, [ProjectEntry.creation_date, ProjectEntry.id])
+
+        shared = {}
+        entries = [entry.as_json(fields, shared) for entry in entries]
+        data = serialisation.dumps({'revision': project.revision,
+                                    'entries': entries, 'next': cursor})
+        return responses.compressed_response(data, 'application/json')
     elif flask.request.method == 'POST':
         if not account_member.access_level.can_edit:
             raise errors.MissingPermission('can_edit')
@@ -280,6 +344,101 @@ def project_entries(project_id):
             raise errors.InvalidFormData(form)
 
 
+@blueprint.route('/projects/<int:project_id>/entries/changes')
+def project_entries_changes(project_id):
+    project = get_project_or_404(project_id)
+    account_member = get_project_member_or_403(project)
+
+    if not account_member.access_level.can_view:
+        raise errors.MissingPermission('can_view')
+
+    try:
+        since = int(flask.request.args['since'])
+    except KeyError:
+        raise errors.InvalidFormData(
+            errors={'since': ['This field is required.']})
+    except ValueError:
+        since = None
+
+    if since is None or not 0 <= since <= project.revision:
+        raise errors.InvalidFormData(
+            errors={'since': ['Not a valid revision.']})
+
+    entries = []
+    deleted = []
+
+    if since < project.revision:
+        entries = flask.g.sql_session.query(ProjectEntry) \
+            .options(*entry_options()) \
+            .filter(ProjectEntry.project_id == project.id) \
+            .filter(ProjectEntry.revision > since) \
+            .order_by(ProjectEntry.creation_date)
+        shared = {}
+        entries = [entry.as_json(shared=shared) for entry in entries]
+
+        tombstones = flask.g.sql_session \
+            .query(ProjectEntryTombstone.entry_id) \
+            .filter(ProjectEntryTombstone.project_id == project.id) \
+            .filter(ProjectEntryTombstone.revision > since)
+        deleted = [entry_id for entry_id, in tombstones]
+
+    data = serialisation.dumps({'revision': project.revision,
+                                'entries': entries, 'deleted': deleted})
+    return responses.compressed_response(data, 'application/json')
+
+
+@blueprint.route('/projects/<int:project_id>/events')
+def project_events(project_id):
+    project = get_project_or_404(project_id)
+    account_member = get_project_member_or_403(project)
+
+    if not account_member.access_level.can_view:
+        raise errors.MissingPermission('can_view')
+
+    broker = events.get_broker()
+
+    try:
+        subscription = broker.subscribe(
+            project.id, schedule='schedule' in flask.request.args)
+    except events.TooManySubscriptions:
+        raise errors.TooBusy(events.KEEP_ALIVE_INTERVAL)
+
+    # a client reconnecting after missing changes is told to catch up
+    last_event_id = flask.request.headers.get('Last-Event-ID')
+    if last_event_id is not None and last_event_id != str(project.revision):
+        subscription.put(events.Event('change', project.revision,
+                                      {'revision': project.revision}))
+
+    response = flask.Response(events.stream(subscription),
+                              mimetype='text/event-stream')
+    # the stream may be closed before it is ever started
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    response.cache_control.no_cache = True
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@blueprint.route('/projects/<int:project_id>/entries/batch', methods=['POST'])
+def project_entries_batch(project_id):
+    project = get_project_or_404(project_id)
+    account_member = get_project_member_or_403(project)
+
+    if not account_member.access_level.can_edit:
+        raise errors.MissingPermission('can_edit')
+
+    try:
+        operations = flask.request.json['operations']
+    except (KeyError, TypeError):
+        raise errors.InvalidFormData(
+            errors={'operations': ['This field is required.']})
+
+    batch = EntryBatch(flask.g.sql_session, project, operations)
+    batch.validate()
+    ids = batch.apply()
+
+    return flask.jsonify(ids=ids)
+
+
 @blueprint.route('/projects/<int:project_id>/entries/<int:entry_id>', methods=['GET', 'PATCH', 'DELETE'])
 def project_entry(project_id, entry_id):
     project = get_project_or_404(project_id)
@@ -296,14 +455,7 @@ def project_entry(project_id, entry_id):
     if flask.request.method == 'GET':
         return flask.jsonify(entry=entry.as_json())
     elif flask.request.method == 'PATCH':
-        validator = Validator({
-            'name': {'type': 'string'},
-            'description': {'type': 'string'},
-            'type': {'type': 'string'},
-            'normal_time_estimate': {'type': 'integer', 'coerce': int},
-            'pessimistic_time_estimate': {'type': 'integer', 'coerce': int},
-            'min_start_date': {'type': 'datetime', 'coerce': dateutil.parser.parse, 'nullable': True},
-        })
+        validator = validation.get_validator('entry')
 
         if validator.validate(flask.request.json, update=True):
             doc = validator.document
@@ -344,18 +496,10 @@ def project_entry(project_id, entry_id):
         else:
             raise errors.InvalidFormData(validator)
     elif flask.request.method == 'DELETE':
-        for d in entry.dependencies:
-            flask.g.sql_session.delete(d)
-        for d in entry.dependees:
-            flask.g.sql_session.delete(d)
-        for r in entry.resources:
-            flask.g.sql_session.delete(r)
-        for m in entry.members:
-            flask.g.sql_session.delete(m)
-
-        flask.g.sql_session.commit()
-
-        flask.g.sql_session.delete(entry)
+        changed_ids = delete_entries(flask.g.sql_session, project.id,
+                                     [entry.id])
+        record_entry_changes(flask.g.sql_session, project.id, changed_ids,
+                             [entry.id])
 
         flask.g.sql_session.commit()
 
@@ -471,17 +615,171 @@ def project_entry_dependency(project_id, parent_id, child_id):
         return '', 204
 
 
+def get_int_arg(name):
+    try:
+        value = flask.request.args[name]
+    except KeyError:
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        raise errors.InvalidFormData(errors={name: ['Not a valid integer.']})
+
+
+def get_date_arg(name):
+    try:
+        value = flask.request.args[name]
+    except KeyError:
+        return None
+
+    try:
+        return dateutil.parser.parse(value).replace(tzinfo=None)
+    except (ValueError, OverflowError):
+        raise errors.InvalidFormData(errors={name: ['Not a valid date.']})
+
+
+def get_gantt_chart_format():
+    """
+    The format a Gantt chart was asked for in, from the ``format`` query
+    parameter or else the Accept header.
+    """
+
+    try:
+        format = flask.request.args['format']
+    except KeyError:
+        pass
+    else:
+        if format not in GANTT_CHART_FORMATS:
+            raise errors.InvalidFormData(
+                errors={'format': ['Not a valid format.']})
+        return format
+
+    best = flask.request.accept_mimetypes.best_match(
+        list(GANTT_CHART_FORMATS.values()))
+    for format, mimetype in GANTT_CHART_FORMATS.items():
+        if mimetype == best:
+            return format
+
+    return 'json'
+
+
 @blueprint.route('/projects/<int:project_id>/gantt-chart')
 def project_gantt_chart(project_id):
-    project = get_project_or_404(project_id)
+    project = get_project_or_404(project_id, graph=True)
+    get_project_member_or_403(project)
+
+    start = get_date_arg('from')
+    end = get_date_arg('to')
+
+    format = get_gantt_chart_format()
+
+    def get_chart_and_blocks():
+        try:
+            chart = Chart(project)
+        except InvalidGanttChart:
+            raise errors.NotFound()
+
+        if start is None and end is None:
+            blocks = None
+        else:
+            blocks = chart.blocks_between(start or chart.start,
+                                          end or chart.end)
+
+        return chart, blocks
+
+    if format == 'binary':
+        # everything in the binary encoding is covered by the content hash,
+        # so it can be served without working out the chart at all
+        key = rendering.RenderCache.key(project.content_hash, 'schedule',
+                                        start, end)
+
+        def render():
+            chart, blocks = get_chart_and_blocks()
+            return chart.as_binary(blocks)
+
+        return responses.cached_response(key, SCHEDULE_MIMETYPE, render)
+
+    with responses.render_slot():
+        chart, blocks = get_chart_and_blocks()
+
+    if format == 'compact':
+        json = serialisation.dumps(
+            {'gantt_chart': chart.as_compact_json(blocks)})
+        return flask.Response(json, mimetype=COMPACT_JSON_MIMETYPE)
+    else:
+        return responses.json_response({'gantt_chart': chart.as_json(blocks)})
+
+
+@blueprint.route('/projects/<int:project_id>/gantt-chart/tiles')
+def project_gantt_chart_tiles(project_id):
+    project = get_project_or_404(project_id, graph=True)
     get_project_member_or_403(project)
 
     try:
-        chart = Chart(project)
+        with responses.render_slot():
+            chart = Chart(project)
     except InvalidGanttChart:
         raise errors.NotFound()
 
-    return flask.jsonify(gantt_chart=chart.as_json())
+    pyramid = rendering.TilePyramid(chart, project)
+    return flask.jsonify(tiles=pyramid.as_json())
+
+
+def export_as_json(job):
+    json = {
+        'id': job['id'],
+        'state': job['state'],
+        'format': job['format'],
+        'raster': job['raster'],
+        'zoom': job.get('zoom', 'hour'),
+    }
+
+    if job['state'] == 'done':
+        json['url'] = flask.url_for('frontend.project_export',
+                                    project_id=job['project_id'],
+                                    export_id=job['id'], format=job['format'])
+    elif job['state'] == 'failed':
+        json['error'] = job['error']
+
+    return json
+
+
+@blueprint.route('/projects/<int:project_id>/exports', methods=['POST'])
+def project_exports(project_id):
+    project = get_project_or_404(project_id)
+    account_member = get_project_member_or_403(project)
+
+    if not account_member.access_level.can_view:
+        raise errors.MissingPermission('can_view')
+
+    validator = validation.get_validator('export')
+
+    if validator.validate(flask.request.json):
+        doc = validator.document
+
+        job = rendering.get_render_queue().submit(
+            project_id=project.id, format=doc['format'],
+            raster=doc.get('raster', False), zoom=doc.get('zoom', 'hour'))
+
+        return flask.jsonify(export=export_as_json(job)), 202
+    else:
+        raise errors.InvalidFormData(validator)
+
+
+@blueprint.route('/projects/<int:project_id>/exports/<export_id>')
+def project_export(project_id, export_id):
+    project = get_project_or_404(project_id)
+    account_member = get_project_member_or_403(project)
+
+    if not account_member.access_level.can_view:
+        raise errors.MissingPermission('can_view')
+
+    job = rendering.get_render_queue().get(export_id)
+    if job is None or job['project_id'] != project.id:
+        raise errors.NotFound()
+
+    return flask.jsonify(export=export_as_json(job))
 
 
 @blueprint.route('/projects/<int:project_id>/members', methods=['GET', 'POST'])
@@ -490,8 +788,28 @@ def project_members(project_id):
     account_member = get_project_member_or_403(project)
 
     if flask.request.method == 'GET':
-        members = [member.as_json() for member in project.members]
-        return flask.jsonify(members=members)
+        fields = listing.get_fields_arg(ProjectMember.JSON_FIELDS)
+
+        query = flask.g.sql_session.query(ProjectMember) \
+            .filter(ProjectMember.project_id == project.id)
+
+        if fields is None or 'account' in fields:
+            query = query.options(sqlalchemy.orm.joinedload('account'))
+
+        access_level = flask.request.args.get('access_level')
+        if access_level is not None:
+            if access_level not in AccessLevel.__members__:
+                raise errors.InvalidFormData(
+                    errors={'access_level': ['Not a valid access level.']})
+            query = query.filter(ProjectMember.access_level == access_level)
+
+        members, cursor = listing.paginate(
+            query, [ProjectMember.account_id, ProjectMember.id])
+
+        shared = {}
+        members = [member.as_json(shared=shared, fields=fields)
+                   for member in members]
+        return responses.json_response({'members': members, 'next': cursor})
     elif flask.request.method == 'POST':
         if not account_member.access_level.can_administrate:
             raise errors.MissingPermission('can_administrate')
@@ -556,8 +874,18 @@ def project_resources(project_id):
     account_member = get_project_member_or_403(project)
 
     if flask.request.method == 'GET':
-        resources = [res.as_json() for res in project.resources]
-        return flask.jsonify(resources=resources)
+        fields = listing.get_fields_arg(ProjectResource.JSON_FIELDS)
+
+        query = flask.g.sql_session.query(ProjectResource) \
+            .filter(ProjectResource.project_id == project.id)
+
+        resources, cursor = listing.paginate(
+            query, [ProjectResource.name, ProjectResource.id])
+
+        resources = [listing.select_fields(res.as_json(), fields)
+                     for res in resources]
+        return responses.json_response({'resources': resources,
+                                        'next': cursor})
     elif flask.request.method == 'POST':
         if not account_member.access_level.can_administrate:
             raise errors.MissingPermission('can_administrate')
@@ -589,14 +917,7 @@ def project_resource(project_id, resource_id):
     resource = get_project_resource_or_404(resource_id)
 
     if flask.request.method == 'PATCH':
-        validator = Validator({
-            'name': {'type': 'string'},
-            'description': {'type': 'string'},
-            'icon': {'type': 'string'},
-            'colour': {'type': 'string'},
-            'amount': {'type': 'integer', 'coerce': int},
-            'reusable': {'type': 'boolean'},
-        })
+        validator = validation.get_validator('resource')
 
         def update_model_values(model, doc, *args):
             for arg in args:
@@ -638,7 +959,16 @@ def error_handler(e):
     except AttributeError:
         pass
 
-    return flask.jsonify(error=error), e.code
+    response = flask.jsonify(error=error)
+    response.status_code = e.code
+
+    # e.g. how long to wait before trying again when the server is too busy
+    for name, value in e.get_headers():
+        if name != 'Content-Type':
+            response.headers[name] = value
+
+    return response
 
 for code in range(400, 499):
     blueprint.errorhandler(code)(error_handler)
+blueprint.errorhandler(503)(error_handler)
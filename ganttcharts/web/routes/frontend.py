@@ -4,32 +4,32 @@ Routes for the front-end.
 
 import datetime
 import functools
-import io
-import math
 
-import cairocffi
-cairocffi.install_as_pycairo()
-import cairosvg
 import flask
-import reportlab.pdfgen.canvas
-import reportlab.lib.pagesizes
-import reportlab.lib.utils
-import PIL.Image
 import sqlalchemy
 
+from ganttcharts import rendering
 from ganttcharts.chart import Chart, InvalidGanttChart
 from ganttcharts.models import Account, AccountEmailAddress, Project, \
-    ProjectMember, ProjectResource, ProjectStar
-from ganttcharts.web import errors, forms
+    ProjectMember, ProjectResource, ProjectStar, load_project_graph
+from ganttcharts.web import errors, forms, responses
 
 
 blueprint = flask.Blueprint('frontend', __name__)
 
 
-def get_project_or_404(project_id):
+def get_project_or_404(project_id, graph=False):
+    """
+    Fetch a project. With graph, everything its chart is scheduled from is
+    loaded up front, rather than a query at a time as it is used.
+    """
+
     try:
-        return flask.g.sql_session.query(Project) \
-            .filter(Project.id == project_id).one()
+        if graph:
+            return load_project_graph(flask.g.sql_session, project_id)
+        else:
+            return flask.g.sql_session.query(Project) \
+                .filter(Project.id == project_id).one()
     except sqlalchemy.orm.exc.NoResultFound:
         raise errors.NotFound()
 
@@ -129,91 +129,106 @@ def view_project(project_id):
     return flask.render_template('projects/view.html', project=project)
 
 
-@blueprint.route('/projects/<int:project_id>/gantt-chart.<format>')
-def project_gantt_chart(project_id, format):
-    project = get_project_or_404(project_id)
-    get_project_member_or_403(project)
+def get_viewport(chart):
+    """
+    Build a viewport from the ``rows`` (e.g. ``100-199``), ``from`` and ``to``
+    (e.g. ``2015-10-01``) query parameters.
+    """
 
-    try:
-        chart = Chart(project)
-    except InvalidGanttChart:
-        chart = None
+    args = flask.request.args
+
+    if chart is None or not any(key in args for key in ('rows', 'from', 'to')):
+        return None
+
+    first_row = last_row = None
+    if 'rows' in args:
+        try:
+            first_row, last_row = (int(x) for x in args['rows'].split('-'))
+        except ValueError:
+            raise errors.InvalidFormData(errors={'rows': ['Not a valid range.']})
+
+    dates = {}
+    for key in ('from', 'to'):
+        if key in args:
+            try:
+                dates[key] = datetime.datetime.strptime(args[key], '%Y-%m-%d').date()
+            except ValueError:
+                raise errors.InvalidFormData(errors={key: ['Not a valid date.']})
 
-    dynamic = format == 'svg'
+    return rendering.Viewport(chart, first_row, last_row, dates.get('from'),
+                              dates.get('to'))
 
-    svg = flask.render_template('projects/gantt-chart.svg', chart=chart,
-                                project=project, dynamic=dynamic,
-                                today=datetime.datetime.utcnow())
+
+def get_zoom():
+    """The zoom level from the ``zoom`` query parameter (e.g. ``week``)."""
+
+    zoom = flask.request.args.get('zoom', 'hour')
+    if zoom not in rendering.ZOOM_LEVELS:
+        raise errors.InvalidFormData(errors={'zoom': ['Not a valid zoom level.']})
+
+    return zoom
+
+
+GANTT_CHART_MIMETYPES = {
+    'svg': 'image/svg+xml',
+    'pdf': 'application/pdf',
+    'png': 'image/png',
+}
+
+
+def render_gantt_chart(chart, project, format, today):
+    """Render a chart, returning either bytes or an iterable of chunks."""
+
+    viewport = get_viewport(chart)
+    zoom = get_zoom()
 
     if format == 'svg':
-        response = flask.make_response(svg)
-        response.mimetype = 'image/svg+xml'
+        return rendering.generate_svg(chart, project, dynamic=True,
+                                      today=today, viewport=viewport,
+                                      zoom=zoom)
     elif format == 'pdf':
-        png = cairosvg.svg2png(svg)
-        image = PIL.Image.open(io.BytesIO(png))
-
-        page_size = tuple(reversed(reportlab.lib.pagesizes.A4))
-        page_margin = 50
-
-        output = io.BytesIO()
-        canvas = reportlab.pdfgen.canvas.Canvas(output, pagesize=page_size)
-
-        def draw_title_header():
-            x = page_size[0] / 2
-            y = page_size[1] - page_margin
-            title1 = 'Gantt Chart for {}'.format(project.name)
-            title2 = '{} to {}'.format(chart.start.date(), chart.end.date())
-            canvas.setFont('Helvetica', 14)
-            canvas.drawCentredString(x, y - 10, title1)
-            canvas.setFont('Helvetica', 10)
-            canvas.drawCentredString(x, y - 25, title2)
-
-        chart_x = page_margin
-        chart_y = page_margin
-        chart_width = int(page_size[0] - chart_x - page_margin)
-        chart_height = int(page_size[1] - chart_y - page_margin - 50)
-
-        new_height = int(chart_height)
-        new_width = int(image.width * (new_height / image.height))
-        image = image.resize((new_width, new_height), PIL.Image.ANTIALIAS)
-
-        def split_image():
-            for i in range(math.ceil(image.width / chart_width)):
-                x2 = (i + 1) * chart_width
-                if x2 >= image.width:
-                    box = (i * chart_width, 0, image.width, image.height)
-
-                    final = PIL.Image.new(mode='RGB',
-                                          size=(chart_width, chart_height),
-                                          color=(255, 255, 255))
-                    final.paste(image.crop(box), (0, 0))
-                    yield final
-                else:
-                    box = (i * chart_width, 0, x2, image.height)
-                    yield image.crop(box)
-
-        for subimage in split_image():
-            canvas.drawImage(reportlab.lib.utils.ImageReader(subimage),
-                             chart_x, chart_y, width=chart_width,
-                             height=chart_height)
-            draw_title_header()
-            canvas.showPage()
-
-        canvas.save()
-
-        pdf = output.getvalue()
-        output.close()
-
-        response = flask.make_response(pdf)
-        response.mimetype = 'application/pdf'
+        if chart is None:
+            raise errors.NotFound()
+
+        if 'raster' in flask.request.args:
+            return rendering.render_raster_pdf(chart, project, today=today,
+                                               zoom=zoom)
+        else:
+            return rendering.render_pdf(chart, project)
     elif format == 'png':
-        png = cairosvg.svg2png(svg)
+        return rendering.render_png(chart, project, today=today,
+                                    viewport=viewport, zoom=zoom)
 
-        response = flask.make_response(png)
-        response.mimetype = 'image/png'
-    else:
+
+@blueprint.route('/projects/<int:project_id>/gantt-chart.<format>')
+def project_gantt_chart(project_id, format):
+    try:
+        mimetype = GANTT_CHART_MIMETYPES[format]
+    except KeyError:
         raise errors.NotFound()
 
+    project = get_project_or_404(project_id, graph=True)
+    get_project_member_or_403(project)
+
+    today = datetime.datetime.utcnow()
+
+    # the SVG highlights today, and the rows which matter to the viewer
+    options = sorted(flask.request.args.items(multi=True))
+    if format == 'svg':
+        options += [today.date(), flask.g.account.id]
+
+    key = rendering.RenderCache.key(project.content_hash, format, options)
+
+    def render():
+        try:
+            chart = Chart(project)
+        except InvalidGanttChart:
+            chart = None
+
+        return render_gantt_chart(chart, project, format, today)
+
+    response = responses.cached_response(key, mimetype, render)
+
     if format != 'svg':
         if not flask.current_app.debug:
             filename = 'Gantt Chart for {}.{}'.format(project.name, format)
@@ -223,6 +238,107 @@ def project_gantt_chart(project_id, format):
     return response
 
 
+@blueprint.route('/projects/<int:project_id>/gantt-chart/tiles/<int:zoom>'
+                 '/<int:x>/<int:y>.png')
+def project_gantt_chart_tile(project_id, zoom, x, y):
+    project = get_project_or_404(project_id, graph=True)
+    get_project_member_or_403(project)
+
+    key = rendering.RenderCache.key(project.content_hash, 'tile', zoom, x, y)
+
+    def render():
+        try:
+            chart = Chart(project)
+        except InvalidGanttChart:
+            raise errors.NotFound()
+
+        pyramid = rendering.TilePyramid(chart, project)
+        if not pyramid.has_tile(zoom, x, y):
+            raise errors.NotFound()
+
+        return pyramid.render_tile(zoom, x, y)
+
+    return responses.cached_response(key, 'image/png', render)
+
+
+@blueprint.route('/projects/<int:project_id>/exports/<export_id>.<format>')
+def project_export(project_id, export_id, format):
+    project = get_project_or_404(project_id)
+    get_project_member_or_403(project)
+
+    job = rendering.get_render_queue().get(export_id)
+    if job is None or job['project_id'] != project.id \
+            or job['format'] != format or job['state'] != 'done':
+        raise errors.NotFound()
+
+    data = rendering.get_render_cache().get(job['key'])
+    if data is None:  # evicted since it was rendered
+        raise errors.NotFound()
+
+    response = flask.Response(data, mimetype=GANTT_CHART_MIMETYPES[format])
+    response.set_etag(job['key'])
+
+    filename = 'Gantt Chart for {}.{}'.format(project.name, format)
+    content_disposition = 'attachment; filename="{}"'.format(filename)
+    response.headers['Content-Disposition'] = content_disposition
+
+    return response
+
+
+# thumbnail URLs carry the project's revision, so they never go stale
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60
+
+
+@blueprint.route('/projects/<int:project_id>/thumbnail.png')
+def project_thumbnail(project_id):
+    """
+    Serve the thumbnail of a project. If the project has changed since its
+    thumbnail was last rendered, a new one is rendered in the background and
+    the old one is served in the meantime.
+    """
+
+    project = get_project_or_404(project_id)
+    get_project_member_or_403(project)
+
+    cache = rendering.get_render_cache()
+
+    key = rendering.thumbnail_key(project)
+    latest_key = rendering.latest_thumbnail_key(project)
+
+    data = cache.get(key)
+    up_to_date = data is not None
+
+    if not up_to_date:
+        data = cache.get(latest_key)
+
+        if data is None:  # never rendered at all, so it cannot wait
+            project = get_project_or_404(project_id, graph=True)
+
+            with responses.render_slot():
+                try:
+                    chart = Chart(project)
+                except InvalidGanttChart:
+                    chart = None
+
+                data = rendering.render_thumbnail(chart, project)
+            cache.put(key, data)
+            cache.put(latest_key, data)
+            up_to_date = True
+        else:
+            rendering.get_render_queue().submit(key, type='thumbnail',
+                                                project_id=project.id)
+
+    response = flask.Response(data, mimetype='image/png')
+    response.cache_control.private = True
+
+    if up_to_date and flask.request.args.get('v') == str(project.revision):
+        response.cache_control.max_age = THUMBNAIL_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+
+    return response
+
+
 @blueprint.route('/projects/<int:project_id>/star')
 @login_required
 def star_project(project_id):
@@ -28,11 +28,15 @@ window.requests = (function(requests) {
           sendData = JSON.stringify(data);
           return this;
         },
+        responseType: function(type) {
+          xhr.responseType = type;
+          return this;
+        },
         go: function(callback) {
           xhr.onload = function() {
             var contentType = xhr.getResponseHeader('Content-Type');
             var response = xhr.response;
-            if (contentType === 'application/json') {
+            if (contentType === 'application/json' && typeof response === 'string') {
               response = JSON.parse(response);
             }
 
@@ -0,0 +1,96 @@
+"""
+Validators for the documents sent to the API.
+
+Cerberus checks a schema every time a validator is made with it, which costs
+more than validating a small document does. Each schema is instead checked
+once, when it is registered, and every thread is then given a copy of the
+validator to reuse, as a validator holds on to the last document it
+validated and its errors.
+"""
+
+import copy
+import datetime
+import threading
+
+from cerberus import Validator
+import dateutil.parser
+
+from ganttcharts import rendering
+
+
+__all__ = ['register', 'get_validator']
+
+
+_prototypes = {}
+_local = threading.local()
+
+
+def register(name, schema):
+    """Check a schema, and make a validator for it available by name."""
+
+    if name in _prototypes:
+        raise ValueError('A schema is already registered as {}.'.format(name))
+
+    _prototypes[name] = Validator(schema)
+
+
+def get_validator(name):
+    """The validator registered by a name, for use by this thread alone."""
+
+    try:
+        validators = _local.validators
+    except AttributeError:
+        validators = _local.validators = {}
+
+    try:
+        return validators[name]
+    except KeyError:
+        validator = validators[name] = copy.copy(_prototypes[name])
+        return validator
+
+
+def coerce_date(string):
+    return datetime.datetime.strptime(string, '%Y-%m-%d')
+
+
+register('account', {
+    'display_name': {'type': 'string'},
+    'receive_summary_email': {'type': 'boolean'},
+})
+
+register('project', {
+    'name': {'type': 'string'},
+    'description': {'type': 'string'},
+})
+
+register('holiday', {
+    'name': {'type': 'string'},
+    'start': {'type': 'datetime', 'coerce': coerce_date},
+    'end': {'type': 'datetime', 'coerce': coerce_date},
+})
+
+register('entry', {
+    'name': {'type': 'string'},
+    'description': {'type': 'string'},
+    'type': {'type': 'string'},
+    'normal_time_estimate': {'type': 'integer', 'coerce': int},
+    'pessimistic_time_estimate': {'type': 'integer', 'coerce': int},
+    'min_start_date': {'type': 'datetime', 'coerce': dateutil.parser.parse,
+                       'nullable': True},
+})
+
+register('export', {
+    'format': {'type': 'string', 'required': True,
+               'allowed': list(rendering.EXPORT_FORMATS)},
+    'raster': {'type': 'boolean'},
+    'zoom': {'type': 'string', 'allowed': list(rendering.ZOOM_LEVELS)},
+})
+
+register('resource', {
+    'name': {'type': 'string'},
+    'description': {'type': 'string'},
+    'icon': {'type': 'string'},
+    'colour': {'type': 'string'},
+    'amount': {'type': 'integer', 'coerce': int},
+    'reusable': {'type': 'boolean'},
+})
@@ -0,0 +1,43 @@
+"""
+Add project revisions
+
+Revision ID: 4e1d7a93c05
+Revises: 2f274e15f34
+Create Date: 2026-10-19 10:12:48.530914
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '4e1d7a93c05'
+down_revision = '2f274e15f34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('project',
+                  sa.Column('revision', sa.Integer, nullable=False,
+                            server_default='0'))
+    op.add_column('project_entry',
+                  sa.Column('revision', sa.Integer, nullable=False,
+                            server_default='0'))
+    op.create_index('ix_project_entry_project_id_revision', 'project_entry',
+                    ['project_id', 'revision'])
+
+    op.create_table('project_entry_tombstone',
+        sa.Column('entry_id', sa.Integer, primary_key=True, nullable=False),
+        sa.Column('project_id', sa.Integer, sa.ForeignKey('project.id'),
+                  nullable=False),
+        sa.Column('revision', sa.Integer, nullable=False),
+    )
+    op.create_index('ix_project_entry_tombstone_project_id_revision',
+                    'project_entry_tombstone', ['project_id', 'revision'])
+
+
+def downgrade():
+    op.drop_table('project_entry_tombstone')
+    op.drop_index('ix_project_entry_project_id_revision', 'project_entry')
+    op.drop_column('project_entry', 'revision')
+    op.drop_column('project', 'revision')
@@ -0,0 +1,51 @@
+"""
+Cascade project deletes
+
+Revision ID: 5b2c81e6f97
+Revises: 4e1d7a93c05
+Create Date: 2026-10-19 14:37:05.182640
+"""
+
+from alembic import op
+
+
+revision = '5b2c81e6f97'
+down_revision = '4e1d7a93c05'
+branch_labels = None
+depends_on = None
+
+
+# (table, column, referred table, referred column) of each foreign key
+# whose rows go when what they refer to does
+FOREIGN_KEYS = [
+    ('project_calendar', 'project_id', 'project', 'id'),
+    ('project_calendar_holiday', 'calendar_id', 'project_calendar',
+     'project_id'),
+    ('project_star', 'project_id', 'project', 'id'),
+    ('project_member', 'project_id', 'project', 'id'),
+    ('project_resource', 'project_id', 'project', 'id'),
+    ('project_entry', 'project_id', 'project', 'id'),
+    ('project_entry_dependency', 'parent_id', 'project_entry', 'id'),
+    ('project_entry_dependency', 'child_id', 'project_entry', 'id'),
+    ('project_entry_member', 'entry_id', 'project_entry', 'id'),
+    ('project_entry_member', 'member_id', 'project_member', 'id'),
+    ('project_entry_resource', 'entry_id', 'project_entry', 'id'),
+    ('project_entry_resource', 'resource_id', 'project_resource', 'id'),
+    ('project_entry_tombstone', 'project_id', 'project', 'id'),
+]
+
+
+def recreate_foreign_keys(**kwargs):
+    for table, column, referred_table, referred_column in FOREIGN_KEYS:
+        name = '{}_{}_fkey'.format(table, column)
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred_table, [column],
+                              [referred_column], **kwargs)
+
+
+def upgrade():
+    recreate_foreign_keys(ondelete='CASCADE')
+
+
+def downgrade():
+    recreate_foreign_keys()
@@ -27,6 +27,12 @@ setup(
         'WTForms-JSON >=0.2, <1',
         'reportlab >=3.2, <4',
     ],
+    extras_require={
+        'brotli': ['brotli >=0.6'],
+        # the first versions with the options ganttcharts.serialisation uses
+        'orjson': ['orjson >=3.1'],
+        'ujson': ['ujson >=4.2'],
+    },
     test_suite='tests',
     entry_points={
         'console_scripts': [
@@ -0,0 +1,37 @@
+import tempfile
+import unittest
+
+from ganttcharts.rendering.admission import Admission, Busy
+
+
+class TestAdmission(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.admission = Admission(self.directory.name, concurrency=2,
+                                   timeout=0.1)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_slots_are_limited(self):
+        first = self.admission.slot()
+        second = self.admission.slot()
+
+        with self.assertRaises(Busy) as context:
+            self.admission.slot()
+        self.assertEqual(context.exception.retry_after, 1)
+
+        first.release()
+        self.admission.slot().release()
+        second.release()
+
+    def test_flight_is_exclusive(self):
+        with self.admission.flight('ab12'):
+            with self.assertRaises(Busy):
+                self.admission.flight('ab12')
+
+        self.admission.flight('ab12').release()
+
+    def test_flights_of_other_keys_do_not_wait(self):
+        with self.admission.flight('ab12'):
+            self.admission.flight('ab13').release()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+from ganttcharts.rendering.cache import RenderCache
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = RenderCache(self.directory.name, max_size=10)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_key_depends_on_parts(self):
+        self.assertEqual(RenderCache.key('a', 1), RenderCache.key('a', 1))
+        self.assertNotEqual(RenderCache.key('a', 1), RenderCache.key('a', 2))
+
+    def test_miss(self):
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertIsNone(self.cache.last_modified('missing'))
+
+    def test_put_and_get(self):
+        self.cache.put('key', b'data')
+        self.assertEqual(self.cache.get('key'), b'data')
+        self.assertIsNotNone(self.cache.last_modified('key'))
+
+    def test_tee(self):
+        chunks = list(self.cache.tee('key', iter(['ab', 'cd'])))
+        self.assertEqual(chunks, [b'ab', b'cd'])
+        self.assertEqual(self.cache.get('key'), b'abcd')
+
+    def test_abandoned_tee_is_not_stored(self):
+        chunks = self.cache.tee('key', iter(['ab', 'cd']))
+        next(chunks)
+        chunks.close()
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_evicts_least_recently_used(self):
+        self.cache.put('old', b'123456')
+        os.utime(self.cache.path('old'), (0, 0))
+        self.cache.put('new', b'123456')
+        self.assertIsNone(self.cache.get('old'))
+        self.assertEqual(self.cache.get('new'), b'123456')
+
+    def test_only_evicts_once_over_the_limit(self):
+        self.cache.put('a', b'1234')
+        os.utime(self.cache.path('a'), (0, 0))
+
+        # written by another process, which this one does not know about
+        with open(self.cache.path('b'), 'wb') as f:
+            f.write(b'1234')
+        os.utime(self.cache.path('b'), (0, 0))
+
+        self.cache.put('c', b'12')
+        self.assertTrue(os.path.exists(self.cache.path('a')))
+        self.assertTrue(os.path.exists(self.cache.path('b')))
+
+        self.cache.put('d', b'12345')
+        self.assertFalse(os.path.exists(self.cache.path('a')))
+        self.assertFalse(os.path.exists(self.cache.path('b')))
+        self.assertEqual(self.cache.get('c'), b'12')
+        self.assertEqual(self.cache.get('d'), b'12345')
@@ -0,0 +1,33 @@
+import gzip
+import unittest
+
+from werkzeug.datastructures import Accept
+
+from ganttcharts.rendering.compression import compress, compress_stream, \
+    is_compressible, negotiate_encoding
+
+
+class TestCompression(unittest.TestCase):
+    def test_compress(self):
+        data = b'<svg></svg>' * 100
+        self.assertEqual(gzip.decompress(compress(data, 'gzip')), data)
+
+    def test_compress_stream(self):
+        chunks = [b'<svg>', b'<rect/>' * 100, b'</svg>']
+        compressed = b''.join(compress_stream(iter(chunks), 'gzip'))
+        self.assertEqual(gzip.decompress(compressed), b''.join(chunks))
+
+    def test_unknown_encoding(self):
+        with self.assertRaises(ValueError):
+            compress(b'data', 'compress')
+
+    def test_negotiate_encoding(self):
+        self.assertEqual(negotiate_encoding(Accept([('gzip', 1)])), 'gzip')
+        self.assertIsNone(negotiate_encoding(Accept([('identity', 1)])))
+        self.assertIsNone(negotiate_encoding(Accept([('gzip', 0)])))
+        self.assertIsNone(negotiate_encoding(Accept()))
+
+    def test_is_compressible(self):
+        self.assertTrue(is_compressible('image/svg+xml'))
+        self.assertTrue(is_compressible('application/json'))
+        self.assertFalse(is_compressible('image/png'))
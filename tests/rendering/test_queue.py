@@ -0,0 +1,49 @@
+import tempfile
+import unittest
+
+from ganttcharts.rendering.queue import RenderQueue
+
+
+class TestRenderQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.queue = RenderQueue(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_submit(self):
+        job = self.queue.submit(project_id=1, format='pdf', raster=False)
+        self.assertEqual(job['state'], 'pending')
+        self.assertEqual(self.queue.get(job['id'])['project_id'], 1)
+
+    def test_submit_same_job_twice(self):
+        job = self.queue.submit('thumbnail-1', project_id=1)
+        again = self.queue.submit('thumbnail-1', project_id=1)
+        self.assertEqual(again['id'], job['id'])
+
+        self.queue.claim()
+        self.assertIsNone(self.queue.claim())
+
+    def test_unknown_job(self):
+        self.assertIsNone(self.queue.get('missing'))
+
+    def test_claim_and_complete(self):
+        job = self.queue.submit(project_id=1, format='pdf', raster=False)
+
+        claimed = self.queue.claim()
+        self.assertEqual(claimed['id'], job['id'])
+        self.assertEqual(claimed['state'], 'running')
+        self.assertIsNone(self.queue.claim())
+
+        self.queue.complete(claimed, 'key')
+        done = self.queue.get(job['id'])
+        self.assertEqual(done['state'], 'done')
+        self.assertEqual(done['key'], 'key')
+
+    def test_fail(self):
+        self.queue.submit(project_id=1, format='png', raster=False)
+        job = self.queue.claim()
+        self.queue.fail(job, 'Broken.')
+        self.assertEqual(self.queue.get(job['id'])['state'], 'failed')
+        self.assertEqual(self.queue.get(job['id'])['error'], 'Broken.')
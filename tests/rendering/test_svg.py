@@ -0,0 +1,57 @@
+import datetime
+import types
+import unittest
+
+from ganttcharts.rendering.svg import Layout
+
+
+class TestLayout(unittest.TestCase):
+    def setUp(self):
+        calendar = types.SimpleNamespace(business_day_length=8)
+        self.project = types.SimpleNamespace(calendar=calendar)
+
+        # a Wednesday
+        self.chart = types.SimpleNamespace(
+            start=datetime.datetime(2015, 10, 7, 9), max_entry_name=10,
+            blocks={}, no_days=60)
+
+    def layout(self, zoom):
+        return Layout(self.chart, self.project, zoom)
+
+    def test_unknown_zoom(self):
+        with self.assertRaises(ValueError):
+            self.layout('fortnight')
+
+    def test_hour(self):
+        layout = self.layout('hour')
+        self.assertEqual(layout.cell_x(11), 22)
+        self.assertEqual(layout.day_x(2), 32)
+        self.assertEqual(layout.day_x(2, end=True), 48)
+
+    def test_day(self):
+        layout = self.layout('day')
+        self.assertEqual(layout.cell_x(11), 8)
+        self.assertEqual(layout.cell_x(11, end=True), 16)
+        self.assertEqual(layout.cell_x(16, end=True), 16)
+
+    def test_week(self):
+        layout = self.layout('week')
+        self.assertEqual(layout.column_of(4), 0)
+        self.assertEqual(layout.column_of(5), 1)
+        self.assertEqual(layout.column_start(0), -2)
+        self.assertEqual(layout.column_start(1), 5)
+        self.assertEqual(layout.cell_x(5 * 8, end=True), 16)
+        self.assertEqual(layout.cell_x(5 * 8 + 1, end=True), 32)
+
+    def test_month(self):
+        layout = self.layout('month')
+        self.assertEqual(layout.column_of(24), 0)
+        self.assertEqual(layout.column_of(25), 1)
+        self.assertEqual(layout.column_start(3), 86)
+        self.assertEqual(layout.column_at(layout.entry_name_column_width
+                                          + 48 * 3), 86)
+
+    def test_zoomed_out_is_narrower(self):
+        widths = [self.layout(zoom).grid_width
+                  for zoom in ('hour', 'day', 'week', 'month')]
+        self.assertEqual(widths, sorted(widths, reverse=True))
@@ -0,0 +1,35 @@
+from collections import namedtuple
+import unittest
+
+from ganttcharts.chart import IntervalIndex
+
+
+FakeBlock = namedtuple('FakeBlock', ['index', 'start', 'end'])
+
+
+class TestIntervalIndex(unittest.TestCase):
+    def setUp(self):
+        self.blocks = [
+            FakeBlock(0, 0, 10),
+            FakeBlock(1, 5, 6),
+            FakeBlock(2, 12, 20),
+            FakeBlock(3, 2, 30),
+            FakeBlock(4, 25, 25),
+        ]
+        self.index = IntervalIndex(self.blocks)
+
+    def brute_force(self, start, end):
+        return [b for b in self.blocks if b.start <= end and b.end >= start]
+
+    def test_matches_linear_scan(self):
+        for start in range(-5, 35):
+            for end in range(start, 40):
+                self.assertEqual(self.index.overlapping(start, end),
+                                 self.brute_force(start, end))
+
+    def test_ordered_by_index(self):
+        indexes = [b.index for b in self.index.overlapping(0, 40)]
+        self.assertEqual(indexes, [0, 1, 2, 3, 4])
+
+    def test_empty(self):
+        self.assertEqual(IntervalIndex([]).overlapping(0, 10), [])
@@ -0,0 +1,54 @@
+import unittest
+
+from ganttcharts import database
+from ganttcharts.models import Account, Project, ProjectEntry, \
+    ProjectEntryDependency, ProjectEntryType, Session, delete_project
+from ganttcharts.web import errors
+from ganttcharts.web.batch import EntryBatch
+
+
+class TestEntryBatch(unittest.TestCase):
+    def setUp(self):
+        database.get_sql_connection()
+        self.session = Session()
+
+        self.account = Account('Batch', 'batch@example.com', 'password')
+        self.project = Project('Batch', '', self.account)
+        self.entries = [ProjectEntry(name, '', ProjectEntryType.task, 1, 2,
+                                     self.project)
+                        for name in ('First', 'Second')]
+
+        self.session.add_all([self.account, self.project] + self.entries)
+        self.session.flush()
+        self.session.add(ProjectEntryDependency(
+            parent_id=self.entries[0].id, child_id=self.entries[1].id))
+        self.session.commit()
+
+    def tearDown(self):
+        delete_project(self.session, self.project.id)
+        for email_address in self.account.email_addresses:
+            self.session.delete(email_address)
+        self.session.delete(self.account)
+        self.session.commit()
+        Session.remove()
+
+    def apply(self, operations):
+        batch = EntryBatch(self.session, self.project, operations)
+        batch.validate()
+        return batch.apply()
+
+    def entry_count(self):
+        return self.session.query(ProjectEntry) \
+            .filter(ProjectEntry.project_id == self.project.id).count()
+
+    def test_delete_every_entry(self):
+        self.apply([{'op': 'delete', 'id': entry.id}
+                    for entry in self.entries])
+        self.assertEqual(self.entry_count(), 0)
+
+    def test_cycle_is_rolled_back(self):
+        with self.assertRaises(errors.InvalidGraph):
+            self.apply([{'op': 'add_dependency',
+                         'parent': self.entries[1].id,
+                         'child': self.entries[0].id}])
+        self.assertEqual(self.entry_count(), 2)